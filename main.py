@@ -1,19 +1,21 @@
 #!/usr/env/bin python
 
 from pathlib import Path
-from typing import TypedDict
+from importlib.metadata import version, PackageNotFoundError
+from time import perf_counter
 
 from pygame import (display, draw, event, key, mouse, time, transform,
-                    QUIT,
+                    QUIT, KEYDOWN, KMOD_CTRL, KMOD_SHIFT,
                     Surface, Vector2,
                     init,
-                    K_ESCAPE)
-from pyndustric import Compiler
+                    K_ESCAPE, K_F3, K_F4, K_TAB, K_t, K_w)
 
-from mlog_lib import setup, mlog_to_python, \
-    TextInputManager, TextInputVisualizer, ColorValue, \
+from mlog_lib import setup, Processor, ProcessorScheduler, MessageBlock, CompilerProcess, CompileService, CompileCache, FrameScheduler, FrameProfiler, \
+    PROCESSOR_TIERS, analyze_cost, \
+    TextInputManager, TextInputVisualizer, Buffer, Workspace, \
     FONT, \
-    app_path, Cbg, Ctxt, Ctxt2, Cerror, Cwarn, font_width, font_height
+    app_path, Cbg, Cfg, Ctxt, Ctxt2, Cerror, Cwarn, font_width, font_height
+from mlog_world import World
 
 
 init()
@@ -22,11 +24,21 @@ WIN: Surface = display.set_mode()
 SC_RES: Vector2 = Vector2(WIN.get_size())
 WIDTH, HEIGHT = SC_RES
 CLOCK: time.Clock = time.Clock()
-COMPILER = Compiler()
+try:
+    COMPILER_VERSION: str = version("pyndustric")
+except PackageNotFoundError:
+    COMPILER_VERSION = ""
+COMPILE_SERVICE = CompileService(CompilerProcess("pyndustric:Compiler"), CompileCache(app_path/"cache", COMPILER_VERSION))
+SCHEDULER = FrameScheduler()
+PROFILER = FrameProfiler()
+PROCESSORS = ProcessorScheduler()
+WORLD: World = World.load(app_path/"scene.json") if (app_path/"scene.json").exists() else World()
 
 save_path: Path = app_path
 
 delta: float = 1/60
+"Real seconds since processors and world were last advanced, idle waits included"
+last_advance: float = perf_counter()
 mouse_pos: Vector2 = Vector2()
 mouse_pressed: tuple[bool, bool, bool]
 keys_pressed: key.ScancodeWrapper
@@ -35,144 +47,183 @@ events: list[event.Event]
 key.set_repeat(200, 100)
 key.start_text_input()
 
-code_textarea: TextInputVisualizer = TextInputVisualizer(TextInputManager().open(),
-                                                         FONT, True, Ctxt,
-                                                         500, 2)
-
-ProcType = TypedDict('ProcType', {
-    'processor_counter': int,
-    'processor_width': int,
-    'processor_color': ColorValue,
-    'processor_textbuffer': str,
-    'processor_surface': Surface,
-    'cell1': list[str],
-})
-
-processor_speed: float = 1/240
-processor_context: ProcType = {
-    "processor_counter": 0,
-    "processor_width": 1,
-    "processor_color": 0,
-    "processor_textbuffer": "",
-    "processor_surface": Surface((176, 176)),
-    "cell1": ["" for _ in range(64)],
-}
-
-
-class Processor:
-    @property
-    def counter(self) -> int:
-        return processor_context["processor_counter"]
-
-    @counter.setter
-    def counter(self, a: int):
-        processor_context["processor_counter"] = a
-
-    @property
-    def textbuffer(self) -> str:
-        return processor_context["processor_textbuffer"]
-
-    @textbuffer.setter
-    def textbuffer(self, a: str):
-        processor_context["processor_textbuffer"] = a
-
-    @property
-    def surface(self) -> Surface:
-        return processor_context["processor_surface"]
-
-
-processor = Processor()
-display1: Surface = Surface(processor.surface.get_size())
-text_surface: Surface
-decoded: list[str] = ["" for _ in range(len(code_textarea.value))]
+processor_speed: float = 240
+LINKS: dict[Processor, dict[str, object]] = {}
+"Buffer processor -> its own memory cell, display and message block(world buildings are shared)"
+
+
+def new_editor(manager: TextInputManager) -> TextInputVisualizer:
+    return TextInputVisualizer(manager, FONT, True, Ctxt, 500, 2)
+
+
+def new_processor() -> Processor:
+    links: dict[str, object] = {
+        "cell1": [0 for _ in range(64)],
+        "display1": Surface((176, 176)),
+        "message1": MessageBlock(),
+    } | WORLD.links()
+    processor = Processor(links, (176, 176), processor_speed, WORLD)
+    processor.surface.fill(Cbg)
+    LINKS[processor] = links
+    return processor
+
+
+WORKSPACE = Workspace(new_editor, new_processor)
+WORKSPACE.add(None)
+code_textarea: TextInputVisualizer = WORKSPACE.focus(0)
+processor: Processor = WORKSPACE.current.processor
 excepp = list[Exception]()
-mlython_str: list[str] = []
+runtime_errors = list[Exception]()
 len_decoded: int = 0
-timer: float = 0
-
-processor.surface.fill(Cbg)
+flushes: int = 0
+closing: Buffer | None = None
+"Modified buffer that Ctrl+W asked to close, second Ctrl+W discards its changes"
 
 
 while True:
-    timer += delta
-    WIN.fill(Cbg)
-
     mouse_pos.update(mouse.get_pos())
     mouse_pressed = mouse.get_pressed()
     keys_pressed = key.get_pressed()
     events = event.get()
+    if not events and not PROCESSORS.running and not COMPILE_SERVICE.pending and not code_textarea.searching:
+        next_wake = PROCESSORS.next_wake
+        events = SCHEDULER.wait(code_textarea.time_to_blink if next_wake is None else
+                                min(code_textarea.time_to_blink, next_wake*1000))
+        mouse_pos.update(mouse.get_pos())
+        keys_pressed = key.get_pressed()
+        PROFILER.mark("idle")
 
     for e in events:
+        if e.type == KEYDOWN and not (e.mod & KMOD_CTRL and e.key == K_w):
+            closing = None
         if e.type == QUIT or keys_pressed[K_ESCAPE]:
             code_textarea.close(False)
+        elif e.type == KEYDOWN and e.key == K_F3:
+            PROFILER.toggle()
+        elif e.type == KEYDOWN and e.key == K_F4 and PROFILER.enabled:
+            PROFILER.export(app_path/"trace.json")
+        elif e.type == KEYDOWN and e.mod & KMOD_CTRL and e.key == K_TAB:
+            WORKSPACE.focus(WORKSPACE.index + (-1 if e.mod & KMOD_SHIFT else 1))
+        elif e.type == KEYDOWN and e.mod & KMOD_CTRL and e.key == K_t:
+            WORKSPACE.add(None)
+            WORKSPACE.focus(len(WORKSPACE)-1)
+        elif e.type == KEYDOWN and e.mod & KMOD_CTRL and e.key == K_w and len(WORKSPACE) > 1:
+            if WORKSPACE.current.modified and closing is not WORKSPACE.current:
+                closing = WORKSPACE.current
+                continue
+            closing = None
+            PROCESSORS.remove(closed := WORKSPACE.remove(WORKSPACE.index).processor)
+            del LINKS[closed]
+            WORKSPACE.focus(WORKSPACE.index)
+    events = [e for e in events if not (e.type == KEYDOWN and e.mod & KMOD_CTRL and e.key in (K_TAB, K_t, K_w))]
+    buffer = WORKSPACE.current
+    code_textarea = WORKSPACE.editor
+    processor = buffer.processor
+    display1: Surface = LINKS[processor]["display1"]  # type: ignore
+    message1: MessageBlock = LINKS[processor]["message1"]  # type: ignore
+    PROFILER.mark("input")
 
     code_textarea.update(events)
-
-    try:
+    PROFILER.mark("edit")
+
+    if code_textarea.generation != COMPILE_SERVICE.latest:
+        COMPILE_SERVICE.submit(code_textarea.generation, str(code_textarea))
+
+    if (compiled := COMPILE_SERVICE.poll()) is not None:
+        buffer.errors = compiled.errors
+        if compiled.mlog != buffer.mlog:
+            buffer.mlog = compiled.mlog
+            processor.load(compiled.program)
+            PROCESSORS.add(processor)
+
+            cost = analyze_cost(compiled.program)
+            buffer.labels = [(line, FONT.render(f"loop: {length} instr", True, Ctxt2))
+                             for line, length in cost.loops.items()]
+            for line, length in cost.frames.items():
+                buffer.labels.append((line, FONT.render(
+                    "frame: unbounded" if length is None else
+                    f"frame: {length} instr, " + ", ".join(f"{tier} {cost.fps(line, tier):.1f} fps" for tier in PROCESSOR_TIERS),
+                    True, Ctxt2)))
+    PROFILER.mark("compile")
+
+    len_decoded = len(processor)
+    now = perf_counter()
+    delta, last_advance = now - last_advance, now
+    WORLD.update(delta)
+    runtime_errors.extend(PROCESSORS.advance(delta))
+    PROFILER.mark("execute")
+
+    flushes_before, flushes = flushes, sum(i.processor.flushes for i in WORKSPACE.buffers)
+    if SCHEDULER.frame(events, code_textarea.rerender_required, compiled, runtime_errors,
+                       flushes != flushes_before, PROFILER.enabled):
         excepp.clear()
-        decoded.clear()
-        mlython_str = COMPILER.compile(str(code_textarea)).splitlines()
-        len_decoded = len(mlython_str)
-    except Exception as e:
-        excepp.append(e)
-        mlython_str = []
-        len_decoded = 0
-
-    if len_decoded:
-        while timer >= processor_speed:
-            processor.counter %= len_decoded
-            timer -= processor_speed
-
-            if raw_line := mlython_str[processor.counter]:  # if not empty
-                k = raw_line.split()
-                decoded.append(tr := mlog_to_python(raw_line))
-                if k[0] == "op" and k[2] not in globals():
-                    tr = f"if \"{k[2]}\" not in dir(): global {k[2]}\n{k[2]} = 0\n{tr}"
-
-                try:
-                    exec(tr, processor_context)  # type: ignore
-                except Exception as e:
-                    excepp.append(e)
-
-            processor.counter = processor.counter + 1
-
-    WIN.blit(transform.flip(display1, False, True), (WIDTH/2-176, 0))
-
-    for j, i in enumerate(excepp):
-        lineno: int = i.args[1][1] - 1 if len(i.args) > 1 else j
-        draw.rect(WIN, Cerror, (WIDTH-font_width, lineno*font_height+code_textarea.v_offset, font_width, font_height))
-        if mouse_pos.x >= WIDTH-font_width and len(i.args) >= 1:
-            draw.rect(WIN, (Cerror[0]//4, Cerror[1]//4, Cerror[2]//4),
-                      (0, lineno*font_height+code_textarea.v_offset, WIDTH-font_width, font_height))
-            WIN.blit(FONT.render(i.args[0], True, Cerror),
-                     (WIDTH-FONT.size(i.args[0])[0]-font_width, font_height*lineno+code_textarea.v_offset))
-
-    for j, i in enumerate(decoded):
-        if i == "NotImplemented":
-            draw.rect(WIN, Cwarn, (WIDTH-font_width, j*font_height+code_textarea.v_offset, font_width, font_height))
-            if mouse_pos.x >= WIDTH-font_width:
-                draw.rect(WIN, (Cwarn[0]//4, Cwarn[1]//4, Cwarn[2]//4),
-                               (0, j*font_height+code_textarea.v_offset, WIDTH-font_width, font_height))
-        if mouse_pos.x <= font_width:
-            WIN.blit(FONT.render(f"{i!r}", True, Ctxt2),
-                     (WIDTH-FONT.size(f"{i!r}")[0]-font_width, font_height*j+code_textarea.v_offset))
-
-    WIN.blit(code_textarea.surface, (0, 0))
-
-    for j, i in enumerate(processor.textbuffer.split('\n')):
-        text_surface = FONT.render(i, True, (127, 255, 127))
-        WIN.blit(text_surface, text_surface.get_rect(bottomright=SC_RES/2+(0, font_height*j+code_textarea.v_offset)))
-    processor.textbuffer = ""
-
-    display.set_caption(f"{code_textarea.filename} - {len(excepp)} error{'s' if len(excepp) != 1 else ''}")
-    if False:
-        WIN.blits([(FONT.render(var, True, Ctxt2), (WIDTH/2, font_height*(y+1)))
-                   for y, var in enumerate((f"{i[0]} = {i[1]!r}"
-                                            for i in globals().items()
-                                            if i[0] not in ("__name__", "__doc__", "__package__", "__loader__", "__spec__", "__annotations__", "__builtins__", "__file__", "__cached__",
-                                                            "_exit", "Path", "display", "draw", "event", "key", "mouse", "time", "transform", "copyright",
-                                                            "QUIT", "Surface", "Vector2", "init", "squit", "K_ESCAPE", "Compiler", "setup", "mlog_to_python", "TextInputManager", "TextInputVisualizer", "FONT",
-                                                            "app_path", "Cbg", "Ctxt", "Ctxt2", "Cerror", "Cwarn", "font_width", "font_height", "processor_context")))])
-
-    display.flip()
-    delta = CLOCK.tick(60)/1000
+        excepp.extend(buffer.errors)
+        excepp.extend(runtime_errors)
+        runtime_errors.clear()
+        WIN.fill(Cbg)
+
+        WIN.blit(transform.flip(display1, False, True), (WIDTH/2-176, 0))
+
+        for j, i in enumerate(excepp):
+            lineno: int = i.args[1][1] - 1 if len(i.args) > 1 else j
+            draw.rect(WIN, Cerror, (WIDTH-font_width, lineno*font_height+code_textarea.v_offset, font_width, font_height))
+            if mouse_pos.x >= WIDTH-font_width and len(i.args) >= 1:
+                draw.rect(WIN, (Cerror[0]//4, Cerror[1]//4, Cerror[2]//4),
+                          (0, lineno*font_height+code_textarea.v_offset, WIDTH-font_width, font_height))
+                WIN.blit(FONT.render(i.args[0], True, Cerror),
+                         (WIDTH-FONT.size(i.args[0])[0]-font_width, font_height*lineno+code_textarea.v_offset))
+
+        for instruction, i in zip(processor.program, processor.decoded):
+            j = instruction.line
+            if i == "NotImplemented":
+                draw.rect(WIN, Cwarn, (WIDTH-font_width, j*font_height+code_textarea.v_offset, font_width, font_height))
+                if mouse_pos.x >= WIDTH-font_width:
+                    draw.rect(WIN, (Cwarn[0]//4, Cwarn[1]//4, Cwarn[2]//4),
+                                   (0, j*font_height+code_textarea.v_offset, WIDTH-font_width, font_height))
+            if mouse_pos.x <= font_width:
+                WIN.blit(FONT.render(f"{i!r}", True, Ctxt2),
+                         (WIDTH-FONT.size(f"{i!r}")[0]-font_width, font_height*j+code_textarea.v_offset))
+
+        if mouse_pos.x > font_width:
+            for j, i in buffer.labels:
+                WIN.blit(i, (WIDTH-i.get_width()-font_width*2, font_height*j+code_textarea.v_offset))
+
+        WIN.blit(code_textarea.surface, (0, 0))
+
+        if len(WORKSPACE) > 1:
+            x = font_width*(code_textarea.linelog+0.5)
+            for j, i in enumerate(WORKSPACE.buffers):
+                tab = FONT.render(f" {i} ", True, Ctxt if j == WORKSPACE.index else Ctxt2,
+                                  Cfg if j == WORKSPACE.index else Cbg)
+                WIN.blit(tab, (x, HEIGHT-font_height*2))
+                x += tab.get_width()
+
+        if closing is not None:
+            WIN.blit(FONT.render(f"{closing} has unsaved changes: Ctrl+W again closes it without saving, Ctrl+S saves",
+                                 True, Cwarn), (font_width*(code_textarea.linelog+0.5), HEIGHT-font_height*3))
+
+        for j, i in enumerate(message1.render(FONT, (127, 255, 127))):
+            WIN.blit(i, i.get_rect(bottomright=SC_RES/2+(0, font_height*j+code_textarea.v_offset)))
+
+        if PROFILER.enabled:
+            hud = PROFILER.render(FONT, Cwarn)
+            for j, i in enumerate(hud):
+                WIN.blit(i, i.get_rect(topright=(WIDTH-font_width*2, HEIGHT-font_height*(len(hud)-j))))
+
+        display.set_caption(f"{code_textarea.filename} - {len(excepp)} error{'s' if len(excepp) != 1 else ''}"
+                            f" - {SCHEDULER.skipped} frames skipped")
+        if False:
+            WIN.blits([(FONT.render(var, True, Ctxt2), (WIDTH/2, font_height*(y+1)))
+                       for y, var in enumerate((f"{i[0]} = {i[1]!r}"
+                                                for i in globals().items()
+                                                if i[0] not in ("__name__", "__doc__", "__package__", "__loader__", "__spec__", "__annotations__", "__builtins__", "__file__", "__cached__",
+                                                                "_exit", "Path", "display", "draw", "event", "key", "mouse", "time", "transform", "copyright",
+                                                                "QUIT", "Surface", "Vector2", "init", "squit", "K_ESCAPE", "Compiler", "setup", "Processor", "ProcessorScheduler", "MessageBlock", "PROCESSOR_TIERS", "analyze_cost", "CompileService", "CompileCache", "FrameScheduler", "TextInputManager", "TextInputVisualizer", "FONT",
+                                                                "app_path", "Cbg", "Ctxt", "Ctxt2", "Cerror", "Cwarn", "font_width", "font_height", "processor_context")))])
+
+        PROFILER.mark("draw")
+        display.flip()
+        PROFILER.mark("flip")
+    CLOCK.tick(60)
+    PROFILER.mark("tick")
+    PROFILER.end_frame()
@@ -0,0 +1,372 @@
+#!/usr/env/bin python
+"""
+Benchmarks of Python -> mlog -> processor pipeline\n
+Every corpus program goes through each stage separately: `compile`(pyndustric),
+`tokenize`, `bind`(`Processor.load`) and `run`(`RUN_STEPS` processor steps).
+Stage reports best time of `--repeat` runs, peak memory traced by tracemalloc
+and how many lines/instructions/steps it put out.
+`numeric-loop` runs the same arithmetic loop through the bound opcode table(`bound`)
+and through the translate-and-`exec` path it replaced(`exec`).
+`unit-control` loads generated world scene(`load`) and runs radar/ulocate/ucontrol script over it(`run`).\n
+`python mlog_bench.py --save` stores baseline, later runs compare against it
+"""
+
+from argparse import ArgumentParser
+from json import dumps as json_dumps, loads as json_loads
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable, NamedTuple
+import tracemalloc
+
+from pygame import Surface
+
+from mlog_lib import Processor, MessageBlock, tokenize, app_path, PROCESSOR_TIERS, TICKS_PER_SECOND
+from mlog_world import World
+
+try:
+    from pyndustric import Compiler
+except ImportError:
+    Compiler = None
+
+
+__all__ = ["SIZES", "RUN_STEPS", "NUMERIC_LOOP", "NUMERIC_STEPS", "WORLD_UNITS", "WORLD_TICKS", "UNIT_CONTROL",
+           "StageResult", "python_source", "mlog_source", "corpus", "world_scene",
+           "legacy_translate", "measure", "numeric", "unit_control", "bench", "scaling", "compare"]
+
+
+SIZES: tuple[int, ...] = (10, 100, 1000, 10000)
+"Lines of generated programs"
+
+RUN_STEPS: int = 100000
+"Processor steps that `run` stage executes"
+
+NUMERIC_LOOP: tuple[str, ...] = (
+    "op add a i 3",
+    "op mul b a 2",
+    "op sub c b i",
+    "op div d c 4",
+    "op mod e i 7",
+    "op add i i 1",
+    "op idiv f i 2",
+    "jump 0 lessThan i 1000000000",
+)
+"8-instruction arithmetic loop of `numeric-loop`"
+
+NUMERIC_STEPS: int = 20000
+"Instructions that each `numeric-loop` stage executes"
+
+WORLD_UNITS: int = 5000
+"Units of `unit-control` scene"
+
+WORLD_TICKS: int = 600
+"Game ticks that `unit-control` runs, hyper processor executes its instructions per tick"
+
+UNIT_CONTROL: tuple[str, ...] = (
+    "ubind @flare",
+    "sensor fx @unit @x",
+    "uradar enemy any any distance 0 1 enemy",
+    "ulocate ore core false @copper ox oy found ore",
+    "ulocate building core false @copper cx cy found core",
+    "ucontrol approach cx cy 10",
+    "radar enemy flying any distance duo1 1 target",
+    "sensor th target @health",
+    "jump 0 always",
+)
+"Unit-control script of `unit-control`, one pass binds next flare and sends it home"
+
+
+class StageResult(NamedTuple):
+    "Measurements of one stage for one corpus program"
+
+    time: float
+    "Best wall time, milliseconds"
+    peak: int
+    "Peak traced memory, bytes"
+    output: int
+    "Mlog lines, instructions or executed steps"
+
+    def __str__(self) -> str:
+        return f"{self.time:10.3f} ms {self.peak/1024:10.1f} KiB {self.output:8}"
+
+
+def python_source(lines: int) -> str:
+    """Program of about `lines` lines in the subset pyndustric compiles:
+    arithmetic, branches, loops and prints. Blocks are never cut in half"""
+
+    out = ["i = 0", "acc = 0"]
+    k = 0
+    while len(out) < lines:
+        match k % 4:
+            case 0:
+                out.append(f"v{k} = acc + {k} * 2")
+            case 1:
+                out += [f"if v{k-1} > {k}:", f"    acc = acc - v{k-1}", "else:", "    acc = acc + 1"]
+            case 2:
+                out += ["i = 0", "while i < 4:", "    acc = acc + i", "    i = i + 1"]
+            case _:
+                out.append("print(acc)")
+        k += 1
+    return "\n".join(out)
+
+
+def mlog_source(lines: int) -> str:
+    "Mlog program of `lines` lines, so later stages can be measured without compiler"
+
+    out = []
+    for n in range(lines):
+        match n % 4:
+            case 0:
+                out.append(f"op add v{n} acc {n}")
+            case 1:
+                out.append(f"jump {n+2} lessThan acc {n}")
+            case 2:
+                out.append("op sub acc acc 1")
+            case _:
+                out.append("print acc")
+    return "\n".join(out)
+
+
+def corpus() -> dict[str, tuple[str, str]]:
+    "Name -> (language, source) of every benchmarked program"
+
+    programs = {"codeexample.mlog": ("mlog", (app_path/"codeexample.mlog").read_text(encoding="utf-8"))}
+    for size in SIZES:
+        programs[f"generated-{size}.py"] = ("python", python_source(size))
+    for size in SIZES:
+        programs[f"generated-{size}.mlog"] = ("mlog", mlog_source(size))
+    return programs
+
+
+def world_scene(units: int = WORLD_UNITS) -> dict:
+    "JSON scene: cores, a turret and ores on a 4000x4000 map, `units` flares and daggers of two teams spread over it"
+
+    buildings = [{"type": "@core-shard", "x": 200, "y": 200, "team": 1, "group": "core"},
+                 {"type": "@core-shard", "x": 3800, "y": 3800, "team": 2, "group": "core"},
+                 {"type": "@duo", "x": 2000, "y": 2000, "team": 1, "name": "duo1", "group": "turret", "range": 110}]
+    buildings += [{"type": "@ore-copper", "x": 97*i % 4000, "y": 61*i % 4000, "group": "ore", "item": "copper"}
+                  for i in range(200)]
+    units = [{"type": "@flare" if i % 2 else "@dagger", "x": 7919*i % 4000, "y": 104729*i % 4000,
+              "team": 1 + i % 3 % 2, "speed": 30, "flying": i % 2, "health": 70}
+             for i in range(units)]
+    return {"cell_size": 64, "buildings": buildings, "units": units}
+
+
+def _unit_run(world: World) -> int:
+    "`WORLD_TICKS` ticks: world moves units, then processor runs `UNIT_CONTROL` for one tick"
+
+    ipt = PROCESSOR_TIERS["hyper"]
+    processor = Processor(world.links(), (176, 176), ipt*TICKS_PER_SECOND, world).load(tokenize(UNIT_CONTROL))
+    for _ in range(WORLD_TICKS):
+        world.update(1/TICKS_PER_SECOND)
+        for _ in range(ipt):
+            processor.step()
+    return WORLD_TICKS * ipt
+
+
+def unit_control(repeat: int = 5) -> dict[str, StageResult]:
+    "Loading of `world_scene` and `UNIT_CONTROL` running over it, every run gets freshly loaded world"
+
+    scene = world_scene()
+    worlds = [World.load(scene) for _ in range(repeat + 1)]  # measure runs stage once more to trace memory
+    return {"load": measure(lambda: World.load(scene), lambda a: len(a.units), repeat)[0],  # type: ignore
+            "run": measure(lambda: _unit_run(worlds.pop()), lambda a: a, repeat)[0]}  # type: ignore
+
+
+def legacy_translate(line: str) -> str:
+    """`set`, `op` and `jump` part of `mlog_to_python`, the f-string translator that opcode table replaced,
+    generating the same code, so `exec` stage measures what the editor used to run"""
+
+    args = line.split()
+    match args[0]:
+        case "set":
+            return f"global {args[1]};{args[1]} = {args[2]}"
+        case "op":
+            args[3], args[4] = f"float({args[3]})", f"float({args[4]})"
+            opeq = {"add": "+", "sub": "-", "mul": "*", "div": "/", "idiv": "//", "mod": "%", "pow": "**",
+                    "lessThan": "<", "lessThanEq": "<=", "greaterThan": ">", "greaterThanEq": ">="}.get(args[1])
+            if opeq is None:
+                return "NotImplemented"
+            return f"_ = {args[3]} {opeq} {args[4]}; {args[2]} = _ if _ % 1 else int(_)"
+        case "jump":
+            cond = {"always": "True", "equal": f"{args[3]} == {args[4]}", "notEqual": f"{args[3]} != {args[4]}",
+                    "lessThan": f"float({args[3]}) < float({args[4]})",
+                    "greaterThan": f"float({args[3]}) > float({args[4]})"}.get(args[2])
+            if cond is None:
+                return "NotImplemented"
+            return f"processor_counter = {args[1]}-1 if {cond} else processor_counter"
+    return "NotImplemented"
+
+
+def _legacy_run(lines: tuple[str, ...], steps: int) -> int:
+    "Old main loop: every executed line is translated and `exec`'d, `op` targets are declared global first"
+
+    context: dict[str, object] = {"processor_counter": 0, "i": 0}
+    for _ in range(steps):
+        context["processor_counter"] %= len(lines)  # type: ignore
+        raw_line = lines[context["processor_counter"]]  # type: ignore
+        k = raw_line.split()
+        tr = legacy_translate(raw_line)
+        if k[0] == "op" and k[2] not in globals():
+            tr = f"if \"{k[2]}\" not in dir(): global {k[2]}\n{k[2]} = 0\n{tr}"
+        exec(tr, context)
+        context["processor_counter"] += 1  # type: ignore
+    return steps
+
+
+def measure(stage: Callable[[], object],
+            output: Callable[[object], int],
+            repeat: int) -> tuple[StageResult, object]:
+    "Times `stage` `repeat` times, then traces its memory once. Returns result and what stage returned"
+
+    best = None
+    value: object = None
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        value = stage()
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    stage()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return StageResult(best/1e6, peak, output(value)), value  # type: ignore
+
+
+def _processor() -> Processor:
+    "Processor linked like the editor's one"
+    return Processor({"cell1": [0 for _ in range(64)], "display1": Surface((176, 176)), "message1": MessageBlock()})
+
+
+def _run(processor: Processor) -> int:
+    for _ in range(RUN_STEPS):
+        processor.step()
+    return RUN_STEPS
+
+
+def numeric(repeat: int = 5) -> dict[str, StageResult]:
+    "`NUMERIC_LOOP` through translate-and-`exec` path and through bound opcode table"
+
+    def bound() -> int:
+        processor = _processor().load(tokenize(NUMERIC_LOOP))
+        for _ in range(NUMERIC_STEPS):
+            processor.step()
+        return NUMERIC_STEPS
+
+    return {"exec": measure(lambda: _legacy_run(NUMERIC_LOOP, NUMERIC_STEPS), lambda a: a, repeat)[0],  # type: ignore
+            "bound": measure(bound, lambda a: a, repeat)[0]}  # type: ignore
+
+
+def bench(repeat: int = 5) -> dict[str, dict[str, StageResult | None]]:
+    "Program -> stage -> result, `None` for stages that can't run(no compiler installed)"
+
+    compiler = None if Compiler is None else Compiler()
+    results: dict[str, dict[str, StageResult | None]] = {}
+
+    for name, (language, source) in corpus().items():
+        stages: dict[str, StageResult | None] = results.setdefault(name, {})
+        if language == "mlog":
+            mlog: list[str] | None = source.splitlines()
+        elif compiler is None:
+            stages["compile"] = None
+            mlog = None
+        else:
+            stages["compile"], text = measure(lambda: compiler.compile(source),  # type: ignore
+                                              lambda a: len(a.splitlines()), repeat)  # type: ignore
+            mlog = text.splitlines()  # type: ignore
+
+        if mlog is None:
+            stages["tokenize"] = stages["bind"] = stages["run"] = None
+            continue
+
+        stages["tokenize"], program = measure(lambda: tokenize(mlog), len, repeat)  # type: ignore
+        stages["bind"], processor = measure(lambda: _processor().load(program), len, repeat)  # type: ignore
+        stages["run"], _ = measure(lambda: _run(processor), lambda a: a, max(1, repeat//2))  # type: ignore
+
+    results["numeric-loop"] = numeric(repeat)  # type: ignore
+    results["unit-control"] = unit_control(max(1, repeat//2))  # type: ignore
+    return results
+
+
+def scaling(results: dict[str, dict[str, StageResult | None]]) -> dict[str, float]:
+    """Stage -> how much slower it got per line between the two biggest generated programs\n
+    1 is linear, noticeably more means stage is superlinear. `run` executes fixed number of steps, so it is left out"""
+
+    ratios: dict[str, float] = {}
+    for suffix in ("py", "mlog"):
+        small, big = (results[f"generated-{i}.{suffix}"] for i in SIZES[-2:])
+        for stage, result in big.items():
+            before = small.get(stage)
+            if result is None or before is None or before.time == 0 or stage == "run":
+                continue
+            ratios[f"{stage}(.{suffix})"] = (result.time/before.time) / (SIZES[-1]/SIZES[-2])
+    return ratios
+
+
+def compare(results: dict[str, dict[str, StageResult | None]],
+            baseline: dict[str, dict[str, list | None]],
+            threshold: float = 0.2) -> list[str]:
+    "Stages that got slower or hungrier than baseline by more than `threshold`"
+
+    regressions: list[str] = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            old = baseline.get(name, {}).get(stage)
+            if result is None or old is None:
+                continue
+            old = StageResult(*old)
+            if result.time > old.time*(1+threshold):
+                regressions.append(f"{name} {stage}: {old.time:.3f} -> {result.time:.3f} ms")
+            if result.peak > old.peak*(1+threshold):
+                regressions.append(f"{name} {stage}: {old.peak/1024:.1f} -> {result.peak/1024:.1f} KiB")
+    return regressions
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.split("\n")[1])  # type: ignore
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage, best one counts")
+    parser.add_argument("--baseline", type=Path, default=app_path/"bench_baseline.json")
+    parser.add_argument("--save", action="store_true", help="store results as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    if Compiler is None:
+        print("pyndustric is not installed, compile stage and generated Python programs are skipped")
+
+    results = bench(args.repeat)
+    for name, stages in results.items():
+        if not any(stages.values()):
+            print(name, "skipped")
+            continue
+        print(name)
+        for stage, result in stages.items():
+            print(f"    {stage:<9}{'skipped' if result is None else result}")
+
+    loop = results["numeric-loop"]
+    exec_us, bound_us = (loop[i].time*1000/NUMERIC_STEPS for i in ("exec", "bound"))  # type: ignore
+    print(f"numeric loop: exec {exec_us:.2f} us/instr, bound {bound_us:.2f} us/instr, x{exec_us/bound_us:.1f}")
+
+    if ratios := scaling(results):
+        print("per-line slowdown from", SIZES[-2], "to", SIZES[-1], "lines:",
+              ", ".join(f"{stage} x{ratio:.2f}" for stage, ratio in ratios.items()))
+
+    if args.save:
+        args.baseline.write_text(json_dumps({name: {stage: None if result is None else list(result)
+                                                    for stage, result in stages.items()}
+                                             for name, stages in results.items()}, indent=1), encoding="utf-8")
+        print("baseline saved to", args.baseline)
+        return 0
+
+    if not args.baseline.exists():
+        print("no baseline at", args.baseline, "run with --save to store one")
+        return 0
+    regressions = compare(results, json_loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+    for i in regressions:
+        print("regression:", i)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,30 @@
+"""
+Compiler process of `CompilerProcess`\n
+`python mlog_compile.py module:Class` creates compiler, then reads sources from stdin
+and answers with mlog text or raised exception. Every message is one line of base64 pickle
+"""
+
+from base64 import b64decode, b64encode
+from importlib import import_module
+from pickle import dumps, loads
+import sys
+
+
+def main() -> None:
+    module, _, name = sys.argv[1].partition(":")
+    compiler = getattr(import_module(module), name)()
+    for line in sys.stdin.buffer:
+        try:
+            reply: object = compiler.compile(loads(b64decode(line)))
+        except Exception as e:
+            reply = e
+        try:
+            data = dumps(reply)
+        except Exception:  # exception that can't be pickled
+            data = dumps(RuntimeError(str(reply)))
+        sys.stdout.buffer.write(b64encode(data) + b"\n")
+        sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,38 @@
-from time import time as unixtime
-from sys import exit as sysexit
-from threading import Thread
-from math import ceil, log10
+from time import time as unixtime, perf_counter_ns
+from sys import exit as sysexit, executable
+from threading import Thread, Condition
+from collections import deque
+from decimal import Decimal
+from math import (log, log10, floor, ceil, sqrt, fmod, hypot, isfinite, pow as fpow,
+                  asin, acos, atan, atan2, degrees, radians,
+                  sin, cos, tan, pi, e as euler)
+from operator import add, sub, mul, truediv, floordiv
+from functools import partial
+from itertools import repeat, count
+from heapq import heappush, heappop
+from enum import IntEnum
+from random import random
+from typing import Callable, Iterator, NamedTuple
+from sys import intern
+from re import compile as re_compile, escape as re_escape, error as re_error, Pattern
+from hashlib import sha256
+from json import dumps as json_dumps
+from marshal import dumps as marshal_dumps, loads as marshal_loads
+from os import getpid, replace, utime
+from subprocess import Popen, PIPE
+from base64 import b64decode, b64encode
+from pickle import dumps as pickle_dumps, loads as pickle_loads
 from platform import system
 from pathlib import Path
 
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename, asksaveasfilename
 
-from pygame import (display, draw, event, font, key, mouse, time,
-                    Color, Surface, quit as squit,
-                    KEYDOWN, KMOD_CTRL, KMOD_SHIFT,
+from pygame import (display, draw, event, font, key, mouse, scrap, time,
+                    Color, Surface, error, quit as squit,
+                    KEYDOWN, KMOD_CTRL, KMOD_SHIFT, NOEVENT, TEXTINPUT,
                     BUTTON_LEFT, BUTTON_WHEELDOWN, BUTTON_WHEELUP,
-                    FINGERDOWN, MOUSEBUTTONDOWN,
+                    FINGERDOWN, MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION,
                     SRCALPHA)
 
 from pygments.token import Keyword, Name, Comment, String, Error, \
@@ -22,9 +42,15 @@ from pygments.lexers import guess_lexer, guess_lexer_for_filename, get_lexer_for
 from pygments.lexer import Lexer
 from pygments import lex
 
+from mlog_world import Content, WorldObject, Building, Unit, World
 
-__all__ = ["logf", "setup", "get_command_color", "mlog_to_python",
-           "TextInputManager", "TextInputVisualizer",
+
+__all__ = ["logf", "setup", "get_command_color",
+           "Opcode", "OPCODES", "OPCODE_KEYS", "Instruction", "tokenize", "lookup_opcode", "Processor",
+           "PROCESSOR_TIERS", "CostReport", "analyze_cost",
+           "MessageBlock", "ProcessorState", "ProcessorScheduler",
+           "CompileResult", "CompileCancelled", "CompilerProcess", "CompileService", "CompileCache", "TRANSLATOR_VERSION",
+           "EditPart", "Edit", "EditJournal", "SearchIndex", "FindBar", "Selection", "TextInputManager", "TextInputVisualizer", "Buffer", "Workspace", "FrameScheduler", "FrameProfiler",
            "ColorValue",
            "app_path"]
 
@@ -81,6 +107,9 @@ Ctxt2: Color = Color(164, 161, 171)
 Coutline: Color = Color(255, 255, 255)
 Cerror: Color = Color(255, 15, 15)
 Cwarn: Color = Color(240, 255, 0)
+Cmatch: Color = Color(98, 83, 31)
+Ccurrent: Color = Color(173, 115, 36)
+Cselect: Color = Color(38, 79, 120)
 
 font.init()
 
@@ -157,19 +186,492 @@ class Vector2i:
         self.y = y
 
 
+class EditPart(NamedTuple):
+    """
+    One caret's share of multi-caret `Edit`: `removed` was replaced with `text`\n
+    `before` is where it starts in document before the edit, `after` - in document after it
+    """
+
+    before: tuple[int, int]
+    after: tuple[int, int]
+    removed: str
+    text: str
+
+
+class Edit(NamedTuple):
+    """
+    Record of `EditJournal`: `text` inserted or deleted at `start`\n
+    Positions are `(x, y)`, `generations` are document generations before and after the edit.
+    Insert that replaced some text keeps it in `removed`,
+    edit made at several carets at once keeps them in `parts` instead of `text`
+    """
+
+    insert: bool
+    start: tuple[int, int]
+    text: str
+    before: tuple[int, int]
+    after: tuple[int, int]
+    generations: tuple[int, int]
+    removed: str = ""
+    parts: tuple[EditPart, ...] = ()
+
+
+_GENERATIONS = count()
+
+
+class EditJournal:
+    """
+    Undo/redo history made of compact insert/delete records\n
+    Consecutive typing or erasing is merged into one record,
+    oldest records are dropped when history takes more than `max_size` bytes.\n
+    `generation` identifies document contents: it changes on every edit and
+    returns to previous value on undo, so caches can be keyed on it.
+    Generations are unique across journals, so buffers can share caches
+    """
+
+    _EDIT_SIZE: int = 120
+    "Approximate size of `Edit` without its text"
+    _PART_SIZE: int = 80
+    "Approximate size of `EditPart` without its text"
+
+    def __init__(self, max_size: int = 4*1024*1024):
+        self.max_size: int = max_size
+        self.generation: int = next(_GENERATIONS)
+        self._undo: deque[Edit] = deque()
+        self._redo: list[Edit] = []
+        self._size: int = 0
+        self._sealed: bool = True
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    @property
+    def size(self) -> int:
+        "Approximate bytes that history takes"
+        return self._size
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def _cost(self, edit: Edit) -> int:
+        return self._EDIT_SIZE + len(edit.text) + len(edit.removed) + \
+            sum(self._PART_SIZE + len(i.text) + len(i.removed) for i in edit.parts)
+
+    def _next_generation(self) -> int:
+        self.generation = next(_GENERATIONS)
+        return self.generation
+
+    def reset(self) -> None:
+        "Forgets history, for changes that journal can't describe(opening file, etc.)"
+
+        self._undo.clear()
+        self._redo.clear()
+        self._size = 0
+        self._sealed = True
+        self._next_generation()
+
+    def seal(self) -> None:
+        "Next edit starts new record instead of merging into previous one"
+        self._sealed = True
+
+    def record(self,
+               insert: bool, start: tuple[int, int], text: str,
+               before: tuple[int, int], after: tuple[int, int],
+               removed: str = "", parts: tuple[EditPart, ...] = ()) -> None:
+        "Adds edit that was just applied to document"
+
+        for i in self._redo:
+            self._size -= self._cost(i)
+        self._redo.clear()
+        generations = (self.generation, self._next_generation())
+
+        if parts:
+            sealed = any("\n" in i.text or "\n" in i.removed or (i.text and i.removed) for i in parts)
+        else:
+            sealed = "\n" in text or bool(removed)
+        merged = None
+        if not (self._sealed or sealed or not self._undo):
+            last = self._undo[-1]
+            merged = self._merge_parts(last, parts, before) if parts else \
+                self._merge(last, insert, start, text, before)
+        if merged is None:
+            edit = Edit(insert, start, text, before, after, generations, removed, parts)
+            self._undo.append(edit)
+            self._size += self._cost(edit)
+        else:
+            self._size -= self._cost(self._undo[-1])
+            self._undo[-1] = merged._replace(after=after, generations=(merged.generations[0], generations[1]))
+            self._size += self._cost(merged)
+        self._sealed = sealed
+
+        while self._size > self.max_size and self._undo:
+            self._size -= self._cost(self._undo.popleft())
+
+    @staticmethod
+    def _merge(last: Edit, insert: bool, start: tuple[int, int], text: str, before: tuple[int, int]) -> Edit | None:
+        if last.parts or last.insert != insert or last.removed or last.after != before or last.start[1] != start[1]:
+            return None
+        if insert and start[0] == last.start[0] + len(last.text):
+            return last._replace(text=last.text + text)
+        if not insert and start[0] + len(text) == last.start[0]:  # backspace
+            return last._replace(start=start, text=text + last.text)
+        if not insert and start == last.start:  # delete
+            return last._replace(text=last.text + text)
+        return None
+
+    @staticmethod
+    def _merge_parts(last: Edit, parts: tuple[EditPart, ...], before: tuple[int, int]) -> Edit | None:
+        "Same as `_merge` for multi-caret edits: every caret has to continue its own part"
+
+        if len(last.parts) != len(parts) or last.after != before:
+            return None
+        merged: list[EditPart] = []
+        for old, new in zip(last.parts, parts):
+            y = old.after[1]
+            if new.before[1] != y or (old.text and old.removed):
+                return None
+            if not old.removed and not new.removed and new.before[0] == old.after[0] + len(old.text):
+                merged.append(EditPart(old.before, (new.after[0] - len(old.text), y), "", old.text + new.text))
+            elif not old.text and not new.text and new.before[0] + len(new.removed) == old.after[0]:  # backspace
+                merged.append(EditPart((old.before[0] - len(new.removed), old.before[1]), new.after, new.removed + old.removed, ""))
+            elif not old.text and not new.text and new.before == old.after:  # delete
+                merged.append(EditPart(old.before, new.after, old.removed + new.removed, ""))
+            else:
+                return None
+        return last._replace(start=merged[0].before, parts=tuple(merged))
+
+    def undo(self) -> Edit | None:
+        "Takes last edit to revert, `None` if there is nothing to undo"
+
+        if not self._undo:
+            return None
+        edit = self._undo.pop()
+        self._redo.append(edit)
+        self.generation = edit.generations[0]
+        self._sealed = True
+        return edit
+
+    def redo(self) -> Edit | None:
+        "Takes last undone edit to apply again, `None` if there is nothing to redo"
+
+        if not self._redo:
+            return None
+        edit = self._redo.pop()
+        self._undo.append(edit)
+        self.generation = edit.generations[1]
+        self._sealed = True
+        return edit
+
+
+def _split_input(events: list[event.Event]) -> list["str | event.Event"]:
+    """Typed text and other key presses in order they came\n
+    `TEXTINPUT`s and printable `KEYDOWN`s(with key repeat) that come in a row are joined into one string"""
+
+    result: list[str | event.Event] = []
+    typed: list[str] = []
+    keydown_text: str = ""
+    for e in events:
+        if e.type == TEXTINPUT:
+            if e.text != keydown_text:  # same text comes with KEYDOWN while text input is active
+                typed.append(e.text)
+            keydown_text = ""
+        elif e.type == KEYDOWN:
+            if e.unicode and e.unicode.isprintable() and not e.mod & KMOD_CTRL:
+                typed.append(e.unicode)
+                keydown_text = e.unicode
+                continue
+            keydown_text = ""
+            if typed:
+                result.append("".join(typed))
+                typed.clear()
+            result.append(e)
+    if typed:
+        result.append("".join(typed))
+    return result
+
+
+class SearchIndex:
+    """
+    Matches of find query in every line of `TextInputManager`, computed lazily\n
+    Spans are kept per line and dropped only for lines that edits replace,
+    so editing a big file doesn't rescan it. Matches don't span lines, empty matches are skipped
+    """
+
+    def __init__(self, manager: "TextInputManager"):
+        self._manager: TextInputManager = manager
+        self.query: str = ""
+        self.regex: bool = False
+        self.error: str | None = None
+        "Why query or replacement is not valid regex"
+        self._pattern: Pattern[str] | None = None
+        self._lines: list[tuple[tuple[int, int], ...] | None] = [()] * len(manager)
+        self._stale: int = 0
+        self._count: int = 0
+        self._scan_at: int = 0
+        manager.listeners.append(self._changed)
+
+    @property
+    def count(self) -> int:
+        "Matches found so far, all of them once index is `complete`"
+        return self._count
+
+    @property
+    def complete(self) -> bool:
+        return self._stale == 0
+
+    def set_query(self, query: str, regex: bool | None = None) -> None:
+        "Changes query, all lines will be matched again"
+
+        if regex is not None:
+            self.regex = regex
+        self.query = query
+        self.error = None
+        try:
+            self._pattern = re_compile(query if self.regex else re_escape(query)) if query else None
+        except re_error as err:
+            self._pattern = None
+            self.error = str(err)
+
+        self._count = 0
+        if self._pattern is None:
+            self._lines = [()] * len(self._manager)
+            self._stale = 0
+        else:
+            self._lines = [None] * len(self._manager)
+            self._stale = len(self._lines)
+
+    def _changed(self, y: int, removed: int, added: int) -> None:
+        for spans in self._lines[y:y+removed]:
+            if spans is None:
+                self._stale -= 1
+            else:
+                self._count -= len(spans)
+        if self._pattern is None:
+            self._lines[y:y+removed] = [()] * added
+        else:
+            self._lines[y:y+removed] = [None] * added
+            self._stale += added
+
+    def line(self, y: int) -> tuple[tuple[int, int], ...]:
+        "`(start, end)` of every match in line"
+
+        spans = self._lines[y]
+        if spans is None:
+            spans = tuple(m.span() for m in self._pattern.finditer(self._manager.value[y])  # type: ignore
+                          if m.end() > m.start())
+            self._lines[y] = spans
+            self._stale -= 1
+            self._count += len(spans)
+        return spans
+
+    def scan(self, budget: int = 4096) -> bool:
+        "Matches up to `budget` more lines, `True` when the whole buffer is matched"
+
+        total = len(self._lines)
+        for _ in range(min(budget, total)):
+            if not self._stale:
+                break
+            if self._scan_at >= total:
+                self._scan_at = 0
+            if self._lines[self._scan_at] is None:
+                self.line(self._scan_at)
+            self._scan_at += 1
+        return not self._stale
+
+    def find(self,
+             start: tuple[int, int], backward: bool = False,
+             inclusive: bool = False) -> tuple[int, int, int] | None:
+        """Closest match after `start`(before it if `backward`), wrapping around buffer\n
+        Returns `(y, start, end)`, `inclusive` also accepts match at `start` itself"""
+
+        if self._pattern is None or not self._lines:
+            return None
+        x, y = start
+        total = len(self._lines)
+        for k in range(total + 1):
+            spans = self.line((y - k if backward else y + k) % total)
+            for x1, x2 in reversed(spans) if backward else spans:
+                if k == 0 and not (x1 < x if backward else x1 > x or inclusive and x1 == x):
+                    continue
+                if k == total and (x1 < x if backward else x1 > x):
+                    continue
+                return ((y - k if backward else y + k) % total, x1, x2)
+        return None
+
+    def replace_all(self, replacement: str) -> int:
+        """Replaces every match as one edit, returns how many were replaced\n
+        In regex mode `replacement` may refer to groups(`\\1`, `\\g<name>`) like in `re.sub`"""
+
+        if self._pattern is None:
+            return 0
+        self.scan(len(self._lines))
+        hit = [y for y, spans in enumerate(self._lines) if spans]
+        if not hit:
+            return 0
+
+        value = self._manager.value
+        first, last = hit[0], hit[-1]
+        lines = value[first:last+1]
+        count = 0
+        expand = self.regex and "\\" in replacement  # without group references template is the text itself
+        try:
+            for y in hit:
+                line = value[y]
+                pieces: list[str] = []
+                end = 0
+                for m in self._pattern.finditer(line):
+                    if m.end() > m.start():  # same matches as `line()` highlights
+                        pieces += (line[end:m.start()], m.expand(replacement) if expand else replacement)
+                        end = m.end()
+                        count += 1
+                pieces.append(line[end:])
+                lines[y-first] = "".join(pieces)
+        except re_error as err:
+            self.error = str(err)
+            return 0
+
+        self._manager.replace((0, first), (len(value[last]), last), "\n".join(lines))
+        return count
+
+
+class FindBar:
+    """
+    Find/replace fields of editor over `SearchIndex` of its manager\n
+    Ctrl+F opens and closes bar, Tab switches field, Enter/Shift+Enter go to next/previous match,
+    Ctrl+R toggles regex, Ctrl+Enter replaces all. Typing a query jumps to first match after cursor
+    """
+
+    def __init__(self, manager: "TextInputManager"):
+        self._manager: TextInputManager = manager
+        self.index: SearchIndex = SearchIndex(manager)
+        self.active: bool = False
+        self.replacement: str = ""
+        self.field: int = 0
+        "0 - query, 1 - replacement"
+        self.current: tuple[int, int, int] | None = None
+        "Match under cursor, `(y, start, end)`"
+        self._anchor: tuple[int, int] = (0, 0)
+
+    def open(self) -> None:
+        self.active = True
+        self.field = 0
+        self._anchor = self._manager.cursor_pos.xy
+        self.index.set_query(self.index.query)
+
+    def close(self) -> None:
+        self.active = False
+        self.current = None
+
+    def _go(self, match: tuple[int, int, int] | None) -> None:
+        self.current = match
+        if match is not None:
+            self._manager.cursor_pos.update(match[1], match[0])
+
+    def find_next(self, backward: bool = False) -> None:
+        self._go(self.index.find(self._manager.clamped(), backward))
+
+    def _edit(self, text: str | None) -> None:
+        "Appends text to current field, `None` erases last character"
+
+        if self.field == 1:
+            self.replacement = self.replacement[:-1] if text is None else self.replacement + text
+            return
+        self.index.set_query(self.index.query[:-1] if text is None else self.index.query + text)
+        self._go(self.index.find(self._anchor, inclusive=True))
+
+    def handle(self, item: "str | event.Event") -> None:
+        "Processes typed text or key press while bar is active"
+
+        if isinstance(item, str):
+            self._edit(item)
+            return
+
+        ctrl = item.mod & KMOD_CTRL
+        match item.key:
+            case 102 if ctrl:   # K_F
+                self.close()
+            case 114 if ctrl:   # K_R
+                self.index.set_query(self.index.query, not self.index.regex)
+                self._go(self.index.find(self._anchor, inclusive=True))
+            case 13 if ctrl:    # K_RETURN
+                self.index.replace_all(self.replacement)
+                self.current = None
+            case 13:            # K_RETURN
+                self.find_next(bool(item.mod & KMOD_SHIFT))
+            case 9:             # K_TAB
+                self.field ^= 1
+            case 8:             # K_BACKSPACE
+                self._edit(None)
+            case _:
+                pass
+
+    def __str__(self) -> str:
+        query = f"find{'(.*)' if self.index.regex else ''}: {self.index.query}"
+        replacement = f"replace: {self.replacement}"
+        status = self.index.error or \
+            f"{self.index.count}{'' if self.index.complete else '+'} match{'es' if self.index.count != 1 else ''}"
+        return f"{query}{'|' if self.field == 0 else ''}   {replacement}{'|' if self.field == 1 else ''}   {status}"
+
+
+class Selection(NamedTuple):
+    """
+    Caret with optional selected range: text between `anchor` and `caret`\n
+    Positions are `(x, y)`, `start` and `end` are ordered by line first
+    """
+
+    anchor: tuple[int, int]
+    caret: tuple[int, int]
+
+    @property
+    def start(self) -> tuple[int, int]:
+        return min(self.anchor, self.caret, key=_order)
+
+    @property
+    def end(self) -> tuple[int, int]:
+        return max(self.anchor, self.caret, key=_order)
+
+    @property
+    def empty(self) -> bool:
+        return self.anchor == self.caret
+
+
+def _order(position: tuple[int, int]) -> tuple[int, int]:
+    "Sort key of `(x, y)` position: line, then column"
+    return (position[1], position[0])
+
+
 class TextInputManager:
     """
-    Class that holds cursor position, file data and other stuff for writing text
+    Class that holds cursor position, file data and other stuff for writing text\n
+    `cursor_pos` is primary caret, `anchor` is where its selection starts(`None` if nothing is selected).
+    Extra carets live in `selections`; with any of them typing and erasing edit every caret in one pass
     """
 
     value: list[str]
     cursor_pos: Vector2i
+    anchor: tuple[int, int] | None
+    selections: list[Selection]
+    journal: EditJournal
+    listeners: list[Callable[[int, int, int], None]]
+    find: FindBar
     _filename: str | Path | None
 
     def __init__(self,
                  initial: list[str] | None = None):
         self.value = initial if initial is not None else [""]
+        self.journal = EditJournal()
         self.cursor_pos = Vector2i(len(self.value[-1]), len(self)-1)
+        self.anchor = None
+        self.selections = []
+        self.listeners = []
+        self.find = FindBar(self)
+        self._filename = None
+        self.saved_generation: int = self.generation
 
     def __str__(self) -> str:
         return "\n".join(self.value)
@@ -188,6 +690,8 @@ class TextInputManager:
     @cur_line.setter
     def cur_line(self, a: str):
         self.value[self.cursor_pos.y] = a
+        self.journal.reset()
+        self.changed(self.cursor_pos.y, 1, 1)
 
     @property
     def left(self) -> list[str]:
@@ -197,9 +701,12 @@ class TextInputManager:
 
     @left.setter
     def left(self, a: list[str]) -> None:
+        old = len(self.value)
         self.value = [*a[:-1],
                       a[-1] + self.right[0],
                       *self.right[1:]]
+        self.journal.reset()
+        self.changed(0, old, len(self.value))
 
     @property
     def right(self) -> list[str]:
@@ -209,9 +716,27 @@ class TextInputManager:
 
     @right.setter
     def right(self, a: list[str]) -> None:
+        old = len(self.value)
         self.value = [*self.left[:-1],
                       self.left[-1] + a[0],
                       *a[1:]]
+        self.journal.reset()
+        self.changed(0, old, len(self.value))
+
+    @property
+    def generation(self) -> int:
+        "Identifies document contents, see `EditJournal.generation`"
+        return self.journal.generation
+
+    @property
+    def modified(self) -> bool:
+        "Text differs from what was opened or saved last"
+        return self.generation != self.saved_generation
+
+    def changed(self, y: int, removed: int, added: int) -> None:
+        "Tells listeners that `removed` lines starting at `y` were replaced with `added` lines"
+        for listener in self.listeners:
+            listener(y, removed, added)
 
     @property
     def filename(self) -> Path | None:
@@ -228,9 +753,13 @@ class TextInputManager:
         if not Path(file).is_file():
             Path(file).touch()
         self._filename = file
+        old = len(self.value)
         with open(file, 'r', encoding='utf-8') as f:
             self.value = f.read().split('\n')
             self.cursor_pos.update(0, 0)
+        self.journal.reset()
+        self.changed(0, old, len(self.value))
+        self.saved_generation = self.generation
         return self
 
     def save(self, file: str | Path | None = None) -> "TextInputManager":
@@ -245,13 +774,362 @@ class TextInputManager:
 
         with open(file, 'w', encoding='utf-8') as f:
             f.write(str(self))
+        self.saved_generation = self.generation
         return self
 
+    def clamped(self) -> tuple[int, int]:
+        "Cursor position that is inside the text"
+        return (min(self.cursor_pos.x, len(self.cur_line)), self.cursor_pos.y)
+
+    def _clamp(self, position: tuple[int, int]) -> tuple[int, int]:
+        y = min(position[1], len(self.value)-1)
+        return (min(position[0], len(self.value[y])), y)
+
+    @property
+    def multi(self) -> bool:
+        "Edits go through selections: something is selected or there are extra carets"
+        return self.anchor is not None or bool(self.selections)
+
+    @property
+    def all_selections(self) -> list[Selection]:
+        "Primary and extra selections inside the text, sorted by position. Primary one is last among equals"
+
+        primary = self.clamped()
+        result = [Selection(self._clamp(i.anchor), self._clamp(i.caret)) for i in self.selections]
+        result.append(Selection(primary if self.anchor is None else self._clamp(self.anchor), primary))
+        result.sort(key=lambda a: _order(a.start))
+        return result
+
+    def collapse(self) -> None:
+        "Drops extra carets and selection"
+        self.anchor = None
+        self.selections = []
+
+    def _normalize(self) -> None:
+        "Removes extra carets that coincide or overlap with others(primary wins)"
+
+        primary = Selection(self.anchor or self.cursor_pos.xy, self.cursor_pos.xy)
+        kept: list[Selection] = []
+        for i in sorted(self.selections, key=lambda a: _order(a.start)):
+            if kept and _order(i.start) <= _order(kept[-1].end) and (not i.empty or i.start == kept[-1].end):
+                continue
+            if _order(i.start) <= _order(primary.end) and _order(primary.start) <= _order(i.end):
+                continue
+            kept.append(i)
+        self.selections = kept
+
+    def text_of(self, selection: Selection) -> str:
+        "Text between selection ends"
+
+        (x1, y1), (x2, y2) = selection.start, selection.end
+        if y1 == y2:
+            return self.value[y1][x1:x2]
+        return "\n".join((self.value[y1][x1:], *self.value[y1+1:y2], self.value[y2][:x2]))
+
+    def _splice(self, ranges: list[tuple[tuple[int, int], tuple[int, int], str]]) -> list[tuple[int, int]]:
+        """Replaces sorted, non-overlapping `(start, end, text)` ranges with one buffer mutation\n
+        Returns where each `text` starts now"""
+
+        first, last = ranges[0][0], ranges[-1][1]
+        pieces: list[str] = []
+        starts: list[tuple[int, int]] = []
+        position, previous = first, first
+        for start, end, text in ranges:
+            gap = self.text_of(Selection(previous, start))
+            position = self._end_of(position, gap)
+            starts.append(position)
+            position = self._end_of(position, text)
+            pieces += (gap, text)
+            previous = end
+
+        (x1, y1), (x2, y2) = first, last
+        lines = (self.value[y1][:x1] + "".join(pieces) + self.value[y2][x2:]).split("\n")
+        self.value[y1:y2+1] = lines
+        self.changed(y1, y2-y1+1, len(lines))
+        return starts
+
+    def _apply(self, edits: list[tuple[tuple[int, int], tuple[int, int], str, bool]]) -> None:
+        """Replaces every `(start, end, text, primary)` range at once\n
+        Ranges are sorted and merged and go into buffer as one mutation and into journal as one
+        multi-caret edit, so k carets cost O(k log k) plus one buffer mutation"""
+
+        edits.sort(key=lambda a: _order(a[0]))
+        merged: list[list] = []
+        for start, end, text, primary in edits:
+            if merged and _order(start) < _order(merged[-1][1]):
+                merged[-1][1] = max(merged[-1][1], end, key=_order)
+                merged[-1][3] = merged[-1][3] or primary
+                continue
+            merged.append([start, end, text, primary])
+
+        before = self.cursor_pos.xy
+        removed = [self.text_of(Selection(start, end)) for start, end, _, _ in merged]
+        starts = self._splice([(start, end, text) for start, end, text, _ in merged])
+        carets = [(self._end_of(at, text), primary) for at, (_, _, text, primary) in zip(starts, merged)]
+        after = next((i for i, primary in carets if primary), carets[-1][0])
+        self.journal.record(True, merged[0][0], "", before, after,
+                            parts=tuple(EditPart(start, at, old, text)
+                                        for at, old, (start, _, text, _) in zip(starts, removed, merged)))
+        self.selections = [Selection(i, i) for i, primary in carets if not primary]
+        self.anchor = None
+        self.cursor_pos.update(*after)
+
+    def type_text(self, text: str) -> None:
+        "Types text at every caret, replacing selected text"
+
+        if not self.multi:
+            self.insert(text)
+            return
+        primary = self.clamped()
+        self._apply([(i.start, i.end, text, i.caret == primary) for i in self.all_selections])
+
+    def erase_at_carets(self, forward: bool = False) -> None:
+        "Backspace(`Delete` if `forward`) at every caret, selections are erased whole"
+
+        primary = self.clamped()
+        edits: list[tuple[tuple[int, int], tuple[int, int], str, bool]] = []
+        for i in self.all_selections:
+            start, end = i.start, i.end
+            if i.empty:
+                x, y = i.caret
+                if forward:
+                    end = (x+1, y) if x < len(self.value[y]) else (0, y+1) if y < len(self)-1 else end
+                else:
+                    start = (x-1, y) if x > 0 else (len(self.value[y-1]), y-1) if y > 0 else start
+            if start != end:
+                edits.append((start, end, "", i.caret == primary))
+        if edits:
+            self._apply(edits)
+        self.anchor = None
+
+    def _moved(self, position: tuple[int, int], key_code: int) -> tuple[int, int]:
+        "Where navigation key moves caret from position"
+
+        x, y = position
+        line = len(self.value[y])
+        match key_code:
+            case 1073741904:             # K_LEFT
+                if x > 0:
+                    return (min(x, line) - 1, y)
+                if y > 0:
+                    return (len(self.value[y-1]), y-1)
+            case 1073741903:             # K_RIGHT
+                if x < line:
+                    return (x + 1, y)
+                if y < len(self)-1:
+                    return (0, y+1)
+            case 1073741906:             # K_UP
+                if y > 0:
+                    return (x, y-1)
+                return (0, 0)
+            case 1073741905:             # K_DOWN
+                if y < len(self)-1:
+                    return (x, y+1)
+                return (len(self.value[-1]), y)
+            case 1073741901:             # K_END
+                return (len(self.value[-1]), len(self)-1)
+            case 1073741898:             # K_HOME
+                return (0, 0)
+        return position
+
+    def move(self, key_code: int, select: bool = False) -> None:
+        "Moves every caret, `select` extends selections instead of dropping them"
+
+        if select and self.anchor is None:
+            self.anchor = self.clamped()
+        self.selections = [Selection(i.anchor if select else caret, caret)
+                           for i in self.selections for caret in (self._moved(i.caret, key_code),)]
+        self.cursor_pos.update(*self._moved(self.cursor_pos.xy, key_code))
+        if not select or self.anchor == self.clamped():
+            self.anchor = None
+        self._normalize()
+
+    def click(self, position: tuple[int, int], add_caret: bool = False) -> None:
+        """Puts caret at clicked position and starts selection there\n
+        With `add_caret` current carets and selections stay and new caret becomes primary"""
+
+        if add_caret:
+            primary = self.clamped()
+            self.selections.append(Selection(primary if self.anchor is None else self._clamp(self.anchor), primary))
+        else:
+            self.selections = []
+        self.anchor = position
+        self.cursor_pos.update(*position)
+        self._normalize()
+
+    def drag(self, position: tuple[int, int]) -> None:
+        "Extends selection started by `click`"
+        self.cursor_pos.update(*position)
+
+    def release(self) -> None:
+        "Ends selection started by `click`, click without dragging leaves just a caret"
+
+        if self.anchor == self.clamped():
+            self.anchor = None
+        self._normalize()
+
+    def select_all(self) -> None:
+        self.selections = []
+        self.anchor = (0, 0)
+        self.cursor_pos.update(len(self.value[-1]), len(self)-1)
+
+    def select_occurrences(self) -> int:
+        """Puts caret on every occurrence of selected text(or word under cursor), selecting it\n
+        Returns how many were found"""
+
+        x, y = self.clamped()
+        if self.anchor is not None:
+            text = self.text_of(Selection(self._clamp(self.anchor), (x, y)))
+        else:
+            line = self.value[y]
+            start, end = x, x
+            while start > 0 and (line[start-1].isalnum() or line[start-1] == "_"):
+                start -= 1
+            while end < len(line) and (line[end].isalnum() or line[end] == "_"):
+                end += 1
+            text = line[start:end]
+        if not text or "\n" in text:
+            return 0
+
+        pattern = re_compile(re_escape(text))
+        found = [Selection((m.start(), i), (m.end(), i)) for i, line in enumerate(self.value) for m in pattern.finditer(line)]
+        primary = next((i for i in found if _order(i.start) <= (y, x) <= _order(i.end)), found[0])
+        self.anchor = primary.anchor
+        self.cursor_pos.update(*primary.caret)
+        self.selections = [i for i in found if i is not primary]
+        return len(found)
+
+    @staticmethod
+    def _end_of(start: tuple[int, int], text: str) -> tuple[int, int]:
+        "Position after `text` inserted at `start`"
+
+        lines = text.count("\n")
+        if not lines:
+            return (start[0] + len(text), start[1])
+        return (len(text) - text.rindex("\n") - 1, start[1] + lines)
+
+    def _insert(self, start: tuple[int, int], text: str) -> tuple[int, int]:
+        x, y = start
+        line = self.value[y]
+        if "\n" not in text:
+            self.value[y] = line[:x] + text + line[x:]
+            self.changed(y, 1, 1)
+        else:
+            lines = text.split("\n")
+            self.value[y:y+1] = [line[:x] + lines[0], *lines[1:-1], lines[-1] + line[x:]]
+            self.changed(y, 1, len(lines))
+        return self._end_of(start, text)
+
+    def _remove(self, start: tuple[int, int], end: tuple[int, int]) -> str:
+        (x1, y1), (x2, y2) = start, end
+        if y1 == y2:
+            line = self.value[y1]
+            self.value[y1] = line[:x1] + line[x2:]
+            self.changed(y1, 1, 1)
+            return line[x1:x2]
+        removed = "\n".join((self.value[y1][x1:], *self.value[y1+1:y2], self.value[y2][:x2]))
+        self.value[y1:y2+1] = [self.value[y1][:x1] + self.value[y2][x2:]]
+        self.changed(y1, y2-y1+1, 1)
+        return removed
+
+    def insert(self, text: str) -> None:
+        "Types text at cursor"
+
+        if not text:
+            return
+        start = self.clamped()
+        end = self._insert(start, text)
+        self.journal.record(True, start, text, self.cursor_pos.xy, end)
+        self.cursor_pos.update(*end)
+
+    def erase(self, start: tuple[int, int], end: tuple[int, int]) -> str:
+        "Removes text between positions, cursor goes to `start`"
+
+        before = self.cursor_pos.xy
+        text = self._remove(start, end)
+        if text:
+            self.journal.record(False, start, text, before, start)
+        self.cursor_pos.update(*start)
+        return text
+
+    def replace(self, start: tuple[int, int], end: tuple[int, int], text: str) -> None:
+        "Replaces text between positions with `text` as one edit, cursor goes after it"
+
+        before = self.cursor_pos.xy
+        removed = self._remove(start, end)
+        after = self._insert(start, text)
+        self.journal.record(True, start, text, before, after, removed)
+        self.cursor_pos.update(*after)
+        self.collapse()
+
+    def undo(self) -> None:
+        if (edit := self.journal.undo()) is None:
+            return
+        self.collapse()
+        if edit.parts:
+            self._splice([(i.after, self._end_of(i.after, i.text), i.removed) for i in edit.parts])
+        elif edit.insert:
+            self._remove(edit.start, self._end_of(edit.start, edit.text))
+            if edit.removed:
+                self._insert(edit.start, edit.removed)
+        else:
+            self._insert(edit.start, edit.text)
+        self.cursor_pos.update(*edit.before)
+
+    def redo(self) -> None:
+        if (edit := self.journal.redo()) is None:
+            return
+        self.collapse()
+        if edit.parts:
+            self._splice([(i.before, self._end_of(i.before, i.removed), i.text) for i in edit.parts])
+        elif edit.insert:
+            if edit.removed:
+                self._remove(edit.start, self._end_of(edit.start, edit.removed))
+            self._insert(edit.start, edit.text)
+        else:
+            self._remove(edit.start, self._end_of(edit.start, edit.text))
+        self.cursor_pos.update(*edit.after)
+
+    def paste(self) -> None:
+        "Inserts clipboard text as one edit"
+
+        try:
+            text = scrap.get_text()
+        except error:
+            return
+        self.journal.seal()
+        self.type_text(text.replace("\r\n", "\n").replace("\r", "\n"))
+        self.journal.seal()
+
+    def copy(self, cut: bool = False) -> None:
+        "Copies selected text(current line if nothing is selected) to clipboard, `cut` also removes it"
+
+        selected = [i for i in self.all_selections if not i.empty]
+        try:
+            scrap.put_text("\n".join(map(self.text_of, selected)) if selected else self.cur_line + "\n")
+        except error:
+            return
+        if cut and selected:
+            self.erase_at_carets()
+        elif cut:
+            y = self.cursor_pos.y
+            if y < len(self)-1:
+                self.erase((0, y), (0, y+1))
+            else:
+                self.erase((0, y), (len(self.cur_line), y))
+
     def update(self, events: list[event.Event]) -> None:
-        "Processes events"
-        for e in events:
-            if e.type == KEYDOWN:
-                self._process_keydown(e)
+        """Processes events\n
+        text typed during one frame(`TEXTINPUT` and printable `KEYDOWN`s, with key repeat)
+        is inserted at once, so it costs one buffer change. While find bar is open it gets the input"""
+
+        for item in _split_input(events):
+            if self.find.active:
+                self.find.handle(item)
+            elif isinstance(item, str):
+                self.type_text(item)
+            else:
+                self._process_keydown(item)
 
     def _process_keydown(self, e: event.Event) -> None:
         if e.mod & KMOD_CTRL:
@@ -265,63 +1143,63 @@ class TextInputManager:
                 case 111:  # K_O
                     Thread(target=self.open, args=('',)).start()
                     return
+                case 122:  # K_Z
+                    if e.mod & KMOD_SHIFT:
+                        self.redo()
+                        return
+                    self.undo()
+                    return
+                case 121:  # K_Y
+                    self.redo()
+                    return
+                case 118:  # K_V
+                    self.paste()
+                    return
+                case 99:   # K_C
+                    self.copy()
+                    return
+                case 120:  # K_X
+                    self.copy(True)
+                    return
+                case 102:  # K_F
+                    self.find.open()
+                    return
+                case 97:   # K_A
+                    self.select_all()
+                    return
+                case 108 if e.mod & KMOD_SHIFT:  # K_L
+                    self.select_occurrences()
+                    return
                 case _:
                     pass
 
         match e.key:
             case 8:                      # K_BACKSPACE
-                if self.cursor_pos.x > 0:
-                    self.cur_line = self.cur_line[:self.cursor_pos.x][:-1] + self.cur_line[self.cursor_pos.x:]
-                    self.cursor_pos.x -= 1
-                elif self.cursor_pos.y > 0:
-                    right_part: str = self.cur_line
-                    self.value.pop(self.cursor_pos.y)
-                    next_cursor_pos: tuple[int, int] = (len(self.value[self.cursor_pos.y-1]), self.cursor_pos.y-1)
-                    self.value[self.cursor_pos.y-1] += right_part
-                    self.cursor_pos.update(*next_cursor_pos)
+                if self.multi:
+                    self.erase_at_carets()
+                    return
+                x, y = self.clamped()
+                if x > 0:
+                    self.erase((x-1, y), (x, y))
+                elif y > 0:
+                    self.erase((len(self.value[y-1]), y-1), (x, y))
             case 127:                    # K_DELETE
-                if self.cursor_pos.x < len(self.cur_line):
-                    self.cur_line = self.cur_line[:self.cursor_pos.x] + self.cur_line[self.cursor_pos.x:][1:]
-                elif self.cursor_pos.y < len(self)-1:
-                    left_part: str = self.value[self.cursor_pos.y+1]
-                    self.value.pop(self.cursor_pos.y+1)
-                    self.cur_line += left_part
-            case 1073741904:             # K_LEFT
-                if self.cursor_pos.x > 0:
-                    self.cursor_pos.x = min(self.cursor_pos.x, len(self.cur_line))
-                    self.cursor_pos.x -= 1
-                elif self.cursor_pos.y > 0:
-                    self.cursor_pos.update(len(self.value[self.cursor_pos.y-1]), self.cursor_pos.y-1)
-            case 1073741903:             # K_RIGHT
-                if self.cursor_pos.x < len(self.cur_line):
-                    self.cursor_pos.x = min(self.cursor_pos.x, len(self.cur_line))
-                    self.cursor_pos.x += 1
-                elif self.cursor_pos.y < len(self)-1:
-                    self.cursor_pos.update(0, self.cursor_pos.y+1)
-            case 1073741906:             # K_UP
-                if self.cursor_pos.y > 0:
-                    self.cursor_pos.y -= 1
-                elif self.cursor_pos.x > 0:
-                    self.cursor_pos.update(0, 0)
-            case 1073741905:             # K_DOWN
-                if self.cursor_pos.y < len(self)-1:
-                    self.cursor_pos.y = min(self.cursor_pos.y, len(self)-1)
-                    self.cursor_pos.y += 1
-                elif self.cursor_pos.x < len(self.cur_line):
-                    self.cursor_pos.update(len(self.value[-1]), len(self)-1)
-            case 1073741901:             # K_END
-                self.cursor_pos.update(len(self.value[-1]), len(self)-1)
-            case 1073741898:             # K_HOME
-                self.cursor_pos.update(0, 0)
+                if self.multi:
+                    self.erase_at_carets(True)
+                    return
+                x, y = self.clamped()
+                if x < len(self.cur_line):
+                    self.erase((x, y), (x+1, y))
+                elif y < len(self)-1:
+                    self.erase((x, y), (0, y+1))
+            case (1073741904 | 1073741903 | 1073741906 |
+                  1073741905 | 1073741901 | 1073741898):
+                self.move(e.key, bool(e.mod & KMOD_SHIFT))  # arrows, END, HOME
             case 13:                     # K_RETURN
-                next_line: str = self.cur_line[self.cursor_pos.x:]
-                self.cur_line = self.cur_line[:self.cursor_pos.x]
-                self.value.insert(self.cursor_pos.y+1, next_line)
-                self.cursor_pos.update(0, self.cursor_pos.y+1)
+                self.type_text("\n")
             case _:
                 if e.unicode.isprintable() and e.unicode:  # UNICODE
-                    self.cur_line = self.cur_line[:self.cursor_pos.x] + e.unicode + self.cur_line[self.cursor_pos.x:]
-                    self.cursor_pos.x += 1
+                    self.type_text(e.unicode)
                 elif e.key in (1073742048, 1073742049, 1073742050, 1073742051,
                                1073742052, 1073742053, 1073742054, 1073742055,
                                27,):  # ESC key and keymods
@@ -357,6 +1235,7 @@ class TextInputVisualizer:
         self._clock: time.Clock = time.Clock()
         self.cursor_blink_interval: int = cursor_blink_interval
         self._cursor_visible: bool = False
+        self._dragging: bool = False
         self._last_blink_toggle: float = 0
 
         self._cursor_width: int = cursor_width
@@ -379,7 +1258,15 @@ class TextInputVisualizer:
 
     @value.setter
     def value(self, a: list[str]):
+        old = len(self._manager.value)
         self._manager.value = a
+        self._manager.journal.reset()
+        self._manager.changed(0, old, len(a))
+
+    @property
+    def generation(self) -> int:
+        "Changes every time text is edited"
+        return self._manager.generation
 
     @property
     def surface(self):
@@ -388,6 +1275,16 @@ class TextInputVisualizer:
             self._rerender_required = False
         return self._surface
 
+    @property
+    def rerender_required(self) -> bool:
+        "Surface will change on next access"
+        return self._rerender_required
+
+    @property
+    def time_to_blink(self) -> float:
+        "Milliseconds until cursor blinks"
+        return max(0, self.cursor_blink_interval - self._last_blink_toggle)
+
     @property
     def linelog(self):
         return self._linelog
@@ -492,12 +1389,34 @@ class TextInputVisualizer:
         squit()
         sysexit()
 
+    @property
+    def modified(self) -> bool:
+        return self._manager.modified
+
+    @property
+    def footprint(self) -> int:
+        "Approximate bytes held: text, undo history and rendered surface"
+        return sum(map(len, self.value)) + 56*len(self.value) + self._manager.journal.size + \
+            self._surface.get_width()*self._surface.get_height()*self._surface.get_bytesize()
+
+    @property
+    def searching(self) -> bool:
+        "Find bar is open and still counting matches"
+        return self._manager.find.active and not self._manager.find.index.complete
+
     def update(self, events: list[event.Event]):
-        value_before = self.value
+        generation_before = self.generation
+        find = self._manager.find
+        match_before = find.current
         self._manager.update(events)
-        if self.value != value_before:
+        if self.generation != generation_before:
             self._linelog = ceil(log10(len(self.value)+1))
             self._require_rerender()
+        if find.active and not find.index.complete:
+            find.index.scan()
+            self._require_rerender()
+        if find.current is not None and find.current != match_before:
+            self._scroll_to(find.current[0])
 
         self._clock.tick()
         self._last_blink_toggle += self._clock.get_time()
@@ -508,7 +1427,7 @@ class TextInputVisualizer:
             self._require_rerender()
 
         for e in events:
-            if e.type == KEYDOWN:
+            if e.type in (KEYDOWN, TEXTINPUT):
                 self._last_blink_toggle = 0
                 self._cursor_visible = True
                 self._require_rerender()
@@ -523,9 +1442,20 @@ class TextInputVisualizer:
                     self._v_offset += font_height * 2
                 elif e.button == BUTTON_LEFT:
                     self._require_rerender()
-                    mouse_pos = mouse.get_pos()
-                    self._manager.cursor_pos.y = max(0, min(int(mouse_pos[1]-self._v_offset)//font_height, len(self._manager)-1))
-                    self._manager.cursor_pos.x = max(0, min(int(mouse_pos[0]//font_width-self._linelog), len(self._manager.cur_line)))
+                    # ctrl+click adds caret
+                    self._manager.click(self._position_at(mouse.get_pos()), bool(key.get_mods() & KMOD_CTRL))
+                    self._dragging = True
+            elif e.type == MOUSEMOTION and self._dragging:
+                self._manager.drag(self._position_at(e.pos))
+                self._require_rerender()
+            elif e.type == MOUSEBUTTONUP and e.button == BUTTON_LEFT and self._dragging:
+                self._dragging = False
+                self._manager.release()
+
+    def _position_at(self, pos: tuple[int, int]) -> tuple[int, int]:
+        "Text position under surface point"
+        y = max(0, min(int(pos[1]-self._v_offset)//font_height, len(self._manager)-1))
+        return (max(0, min(int(pos[0]//font_width-self._linelog), len(self.value[y]))), y)
 
     def _try_lint(self, file: str | Path | None = None):
         if file is None:
@@ -541,17 +1471,50 @@ class TextInputVisualizer:
     def _require_rerender(self):
         self._rerender_required = True
 
+    def _scroll_to(self, y: int) -> None:
+        "Scrolls so line is visible, centering it if it was not"
+
+        if y not in self.visible_lines[:-2]:
+            rows = self._surface.get_height()//font_height
+            self._v_offset = -font_height*max(0, y - rows//2)
+        self._require_rerender()
+
+    @property
+    def visible_lines(self) -> range:
+        "Lines that are on the surface"
+        first = max(0, int(-self._v_offset // font_height))
+        return range(first, min(len(self.value), first + self._surface.get_height()//font_height + 2))
+
     def _render(self):
         self._surface.fill((0, 0, 0, 0))
+        visible = self.visible_lines
 
-        for i in range(len(self.value)):
+        for i in visible:
             self._surface.blit(self._font_object.render(f"{i+1}", True, Ctxt), (self._h_offset, font_height*i+self._v_offset))
 
         draw.aaline(self._surface, Coutline, (font_width*self._linelog, 0), (font_width*self._linelog, self._surface.get_height()))
 
+        find = self._manager.find
+        if find.active:
+            for y in visible:
+                for x1, x2 in find.index.line(y):
+                    draw.rect(self._surface, Ccurrent if find.current == (y, x1, x2) else Cmatch,
+                              ((x1+self._linelog+0.5)*font_width, y*font_height+self._v_offset,
+                               (x2-x1)*font_width, font_height))
+
+        if self._manager.multi:
+            for selection in self._manager.all_selections:
+                (x1, y1), (x2, y2) = selection.start, selection.end
+                for y in range(max(y1, visible.start), min(y2+1, visible.stop)):
+                    start = x1 if y == y1 else 0
+                    end = x2 if y == y2 else len(self.value[y]) + 1
+                    draw.rect(self._surface, Cselect,
+                              ((start+self._linelog+0.5)*font_width, y*font_height+self._v_offset,
+                               (end-start)*font_width, font_height))
+
         if self._lexer is None:
-            for j, i in enumerate(self.value):
-                self._surface.blit(FONT.render(i, True, Ctxt),
+            for j in visible:
+                self._surface.blit(FONT.render(self.value[j], True, Ctxt),
                                    (font_width*(self._linelog+0.5), font_height*j+self._v_offset))
         else:
             tx = ty = 0
@@ -559,7 +1522,9 @@ class TextInputVisualizer:
                 if '\n' in value:
                     tx = len(value.split('\n')[-1])
                     ty += value.count('\n')
-                if value.strip():
+                    if ty >= visible.stop:
+                        break
+                if value.strip() and ty >= visible.start:
                     clr = get_command_color(ttype, value)
                     self._surface.blit(FONT.render(value, True, clr),
                                         (font_width*(self._linelog+0.5)+tx*font_width,
@@ -570,6 +1535,294 @@ class TextInputVisualizer:
             draw.rect(self._surface, (255, 255, 255),
                       ((self.cursor.x+self._linelog+0.5)*font_width, (self.cursor.y)*font_height+self._v_offset,
                        self._cursor_width, font_height))
+            for x, y in (i.caret for i in self._manager.selections):
+                draw.rect(self._surface, (255, 255, 255),
+                          ((x+self._linelog+0.5)*font_width, y*font_height+self._v_offset,
+                           self._cursor_width, font_height))
+
+        if find.active:
+            bar = self._font_object.render(str(find), True, Cerror if find.index.error else Ctxt)
+            y = self._surface.get_height() - font_height
+            self._surface.fill(Cfg, (0, y, self._surface.get_width(), font_height))
+            self._surface.blit(bar, (font_width*(self._linelog+0.5), y))
+
+
+class Buffer:
+    """
+    Tab of `Workspace`: source file with its editor and processor\n
+    Editor is created when tab is first focused and dropped on eviction,
+    processor keeps its compiled program and keeps running either way
+    """
+
+    _ids = count(1)
+
+    def __init__(self, path: Path | None, processor: "Processor"):
+        self.id: int = next(Buffer._ids)
+        self.path: Path | None = path
+        "File of buffer as of last load or unload, editor's `filename` is current one while loaded"
+        self.opened: bool = False
+        "File was opened(or asked for) once, later loads restore buffer as it was"
+        self.processor: Processor = processor
+        self.editor: TextInputVisualizer | None = None
+        self.mlog: list[str] = []
+        "Compiled source of running program"
+        self.errors: list[Exception] = []
+        self.labels: list[tuple[int, Surface]] = []
+        "Gutter labels of compiled program"
+        self.swap: Path | None = None
+        "Unsaved text of evicted buffer"
+        self.focused_at: int = 0
+
+    def __str__(self) -> str:
+        path = self.path if self.editor is None else self.editor.filename
+        name = "untitled" if path is None else path.name
+        return f"{name}*" if self.modified else name
+
+    @property
+    def modified(self) -> bool:
+        "Has unsaved text, in editor or in swap file"
+        return self.swap is not None or self.editor is not None and self.editor.modified
+
+    @property
+    def loaded(self) -> bool:
+        return self.editor is not None
+
+    @property
+    def footprint(self) -> int:
+        "Approximate bytes held while loaded"
+        return 0 if self.editor is None else self.editor.footprint
+
+
+class Workspace:
+    """
+    Open buffers(tabs), one per processor program\n
+    Files are read when their tab is first focused. Past `memory_budget` bytes,
+    least recently focused buffers are unloaded: unsaved text goes to swap file in `swap_directory`,
+    undo history is dropped. Background buffers are never rendered
+    """
+
+    def __init__(self,
+                 new_editor: Callable[[TextInputManager], "TextInputVisualizer"],
+                 new_processor: Callable[[], "Processor"],
+                 memory_budget: int = 128*1024*1024,
+                 swap_directory: Path = app_path/"cache"/"swap"):
+        self._new_editor: Callable[[TextInputManager], TextInputVisualizer] = new_editor
+        self._new_processor: Callable[[], Processor] = new_processor
+        self.memory_budget: int = memory_budget
+        self.swap_directory: Path = swap_directory
+        self.buffers: list[Buffer] = []
+        self.index: int = 0
+        self.evictions: int = 0
+        self._focus_count = count(1)
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    @property
+    def current(self) -> Buffer:
+        return self.buffers[self.index]
+
+    @property
+    def editor(self) -> "TextInputVisualizer":
+        "Editor of focused buffer"
+        return self.current.editor  # type: ignore
+
+    def add(self, path: str | Path | None) -> Buffer:
+        "Opens buffer without reading its file, `None` asks for file(without waiting for answer) when buffer is focused"
+
+        buffer = Buffer(None if path is None else Path(path), self._new_processor())
+        self.buffers.append(buffer)
+        return buffer
+
+    def remove(self, index: int) -> Buffer:
+        "Closes buffer without saving it, check `Buffer.modified` first"
+
+        buffer = self.buffers.pop(index)
+        if buffer.swap is not None:
+            buffer.swap.unlink(missing_ok=True)
+        if self.index >= len(self.buffers):
+            self.index = max(0, len(self.buffers)-1)
+        return buffer
+
+    def focus(self, index: int) -> "TextInputVisualizer":
+        "Switches to buffer, loading it if needed"
+
+        self.index = index % len(self.buffers)
+        buffer = self.current
+        buffer.focused_at = next(self._focus_count)
+        if buffer.editor is None:
+            self._load(buffer)
+            self._evict()
+        return buffer.editor  # type: ignore
+
+    def _load(self, buffer: Buffer) -> None:
+        if buffer.path is None:
+            manager = TextInputManager()
+            if not buffer.opened:  # file dialog runs on its own thread like Ctrl+O, buffer stays untitled if it is cancelled
+                Thread(target=manager.open, args=('',)).start()
+        else:
+            manager = TextInputManager().open(buffer.path)
+        buffer.opened = True
+        buffer.path = manager.filename
+        buffer.editor = self._new_editor(manager)
+        if buffer.swap is not None:
+            buffer.editor.value = buffer.swap.read_text(encoding="utf-8").split("\n")
+            buffer.swap.unlink(missing_ok=True)
+            buffer.swap = None
+
+    def _evict(self) -> None:
+        "Unloads least recently focused buffers until loaded ones fit `memory_budget`"
+
+        loaded = sorted((i for i in self.buffers if i.loaded and i is not self.current), key=lambda a: a.focused_at)
+        total = sum(i.footprint for i in self.buffers)
+        for buffer in loaded:
+            if total <= self.memory_budget:
+                break
+            total -= buffer.footprint
+            self._unload(buffer)
+
+    def _unload(self, buffer: Buffer) -> None:
+        editor: TextInputVisualizer = buffer.editor  # type: ignore
+        buffer.path = editor.filename
+        if editor.modified:
+            self.swap_directory.mkdir(parents=True, exist_ok=True)
+            buffer.swap = self.swap_directory/f"{getpid()}-{buffer.id}.swap"
+            buffer.swap.write_text(str(editor), encoding="utf-8")
+        buffer.editor = None
+        self.evictions += 1
+
+
+class FrameScheduler:
+    """
+    Decides whether main loop has to draw frame, and sleeps while there is nothing to do\n
+    `drawn` and `skipped` count frames since start
+    """
+
+    def __init__(self):
+        self.drawn: int = 0
+        self.skipped: int = 0
+        self._requested: bool = True
+
+    def request(self) -> None:
+        "Next frame is drawn regardless of reasons"
+        self._requested = True
+
+    def wait(self, timeout: float) -> list[event.Event]:
+        "Blocks until any event comes or `timeout` milliseconds pass"
+
+        first = event.wait(max(1, int(timeout)))
+        if first.type == NOEVENT:
+            return []
+        return [first, *event.get()]
+
+    def frame(self, *reasons: object) -> bool:
+        "`True` if frame must be drawn: it was requested or any of reasons is true"
+
+        if self._requested or any(reasons):
+            self._requested = False
+            self.drawn += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+class FrameProfiler:
+    """
+    Times phases of main loop into ring buffer of last `capacity` records\n
+    `mark(phase)` ends phase that started at previous mark, `end_frame()` closes frame.
+    While profiler is disabled both return right away, so marks can stay in the loop
+    """
+
+    refresh: int = 15
+    "Frames between HUD updates"
+
+    def __init__(self, capacity: int = 4096):
+        self.enabled: bool = False
+        self.capacity: int = capacity
+        self.frames: int = 0
+        self._names: list[str] = [""] * capacity
+        self._starts: list[int] = [0] * capacity
+        self._durations: list[int] = [0] * capacity
+        self._head: int = 0
+        self._size: int = 0
+        self._last: int = 0
+        self._frame_start: int = 0
+        self._surfaces: list[Surface] | None = None
+
+    def toggle(self) -> bool:
+        "Turns profiler on or off, returns new state"
+
+        self.enabled = not self.enabled
+        self._last = self._frame_start = perf_counter_ns()
+        self._surfaces = None
+        return self.enabled
+
+    def _push(self, name: str, start: int, end: int) -> None:
+        i = self._head
+        self._names[i] = name
+        self._starts[i] = start
+        self._durations[i] = end - start
+        self._head = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def mark(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = perf_counter_ns()
+        self._push(phase, self._last, now)
+        self._last = now
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        now = perf_counter_ns()
+        self._push("frame", self._frame_start, now)
+        self._last = self._frame_start = now
+        self.frames += 1
+        if self.frames % self.refresh == 0:
+            self._surfaces = None
+
+    def records(self) -> Iterator[tuple[str, int, int]]:
+        "Phase, start and duration in nanoseconds, oldest first"
+
+        first = self._head - self._size
+        for k in range(first, self._head):
+            i = k % self.capacity
+            yield self._names[i], self._starts[i], self._durations[i]
+
+    def stats(self) -> dict[str, tuple[float, float, float, float]]:
+        "Phase -> last, p50, p95 and p99 duration in milliseconds"
+
+        samples: dict[str, list[int]] = {}
+        for name, _, duration in self.records():
+            samples.setdefault(name, []).append(duration)
+
+        result: dict[str, tuple[float, float, float, float]] = {}
+        for name, values in samples.items():
+            last = values[-1]
+            values.sort()
+            p50, p95, p99 = (values[min(len(values)-1, int(len(values)*q))] for q in (0.5, 0.95, 0.99))
+            result[name] = (last/1e6, p50/1e6, p95/1e6, p99/1e6)
+        return result
+
+    def render(self, font_object: font.Font, color: ColorValue) -> list[Surface]:
+        "HUD lines: milliseconds per phase, updated every `refresh` frames"
+
+        if self._surfaces is None:
+            lines = [f"{'phase':<9}{'last':>7}{'p50':>7}{'p95':>7}{'p99':>7}"]
+            lines.extend(f"{name:<9}{last:7.2f}{p50:7.2f}{p95:7.2f}{p99:7.2f}"
+                         for name, (last, p50, p95, p99) in self.stats().items())
+            self._surfaces = [font_object.render(i, True, color) for i in lines]
+        return self._surfaces
+
+    def export(self, path: Path) -> int:
+        "Writes records as Chrome trace events(chrome://tracing, Perfetto), returns their count"
+
+        events = [{"name": name, "ph": "X", "ts": start/1000, "dur": duration/1000, "pid": 1, "tid": 1}
+                  for name, start, duration in self.records()]
+        path.write_text(json_dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+        return len(events)
 
 
 def askopenas() -> str | None:
@@ -669,14 +1922,8 @@ def raw2d(seed: int, x: float, y: float) -> float:
 
 
 def setup():
-    "Imports everything for correct translation to mlog"
-
-    exec("""from math import (log, log10, floor, ceil, sqrt,
-                              asin, acos, atan, atan2,
-                              sin, cos, tan, pi)\
-            \nfrom random import random\
-            \nfrom pygame import draw\
-            \nfrom mlog_lib import raw2d""")
+    "Prepares files used by library"
+
     if not logfile.exists():
         logfile.touch()
 
@@ -697,175 +1944,1317 @@ def get_command_color(token: _TokenType, v: str = 'None') -> tuple[int, int, int
     return out
 
 
-def mlog_to_python(code: str) -> str:
-    """Transforms Mlog code to Python code.\n
-    args[0] is the name of command\n
-    args[1] is the type of command if command is draw or op, else it is first arg\n
-    other args is just args"""
-
-    args: list[str] = code.split()
-
-    match args[0]:
-        case "read":
-            return f"{args[1]} = {args[2]}[{args[3]}]"
-        case "write":
-            return f"{args[2]}[{args[3]}] = {args[1]}"
-        case "draw":
-            match args[1]:
-                case "clear":
-                    return f"processor_surface.fill(({int(args[2])}, {int(args[3])}, {int(args[4])}))"
-                case "color":
-                    return f"processor_color = ({args[2]}, {args[3]}, {args[4]}, {args[5]})"
-                case "col":
-                    return f"processor_color = ({int(args[2][1:3], base=16)}, {int(args[2][3:5], base=16)}, {int(args[2][5:7], base=16)})"
-                case "stroke":
-                    return f"processor_width = {args[2]}"
-                case "line":
-                    return f"draw.line(processor_surface, processor_color, ({args[2]}, {args[3]}), ({args[4]}, {args[5]}), processor_width)"
-                case "rect":
-                    return f"draw.rect(processor_surface, processor_color, ({args[2]}, {args[3]}, {args[4]}, {args[5]}))"
-                case "lineRect":
-                    return f"draw.rect(processor_surface, processor_color, ({args[2]}, {args[3]}, {args[4]}, {args[5]}), processor_width)"
-                case "poly":
-                    return f"draw.polygon(processor_surface, processor_color, [({args[2]}+cos(pi*2/{args[4]}*j+{args[6]})*{args[5]}, {args[3]}+sin(pi*2/{args[4]}*j+{args[6]})*{args[5]}) for j in range({args[4]})])"
-                case "linePoly":
-                    return f"draw.polygon(processor_surface, processor_color, [({args[2]}+cos(pi*2/{args[4]}*j+{args[6]})*{args[5]}, {args[3]}+sin(pi*2/{args[4]}*j+{args[6]})*{args[5]}) for j in range({args[4]})], processor_width)"
-                case "triangle":
-                    return f"draw.polygon(processor_surface, processor_color, (({args[2]}, {args[3]}), ({args[4]}, {args[5]}), ({args[6]}, {args[7]})))"
-                case "image":
-                    return "NotImplemented"
-                case _:
-                    return "NotImplemented"
-        case "print":
-            return f"processor_textbuffer += str({args[1]})"
-
-        case "drawflush":
-            return f"{args[1]}.blit(processor_surface, (0, 0))"
-        case "printflush":
-            return ''
-
-        case "set":
-            return f"global {args[1]};{args[1]} = {args[2]}"
-        case "op":
-            opeq: str = "0"
-            args[3], args[4] = f'float({args[3]})', f'float({args[4]})'
-            match args[1]:
-                case "add":
-                    opeq = f"{args[3]} + {args[4]}"
-                case "sub":
-                    opeq = f"{args[3]} - {args[4]}"
-                case "mul":
-                    opeq = f"{args[3]} * {args[4]}"
-                case "div":
-                    opeq = f"{args[3]} / {args[4]}"
-                case "idiv":
-                    opeq = f"{args[3]} // {args[4]}"
-                case "mod":
-                    opeq = f"{args[3]} % {args[4]}"
-                case "pow":
-                    opeq = f"{args[3]} ** {args[4]}"
-
-                case "equal":
-                    opeq = f"abs({args[3]} - {args[4]}) < 0.000001"
-                case "notEqual":
-                    opeq = f"abs({args[3]} - {args[4]}) >= 0.000001"
-                case "land":
-                    opeq = f"{args[3]} != 0 && {args[4]} != 0"
-                case "lessThan":
-                    opeq = f"{args[3]} < {args[4]}"
-                case "lessThanEq":
-                    opeq = f"{args[3]} <= {args[4]}"
-                case "greaterThan":
-                    opeq = f"{args[3]} > {args[4]}"
-                case "greaterThanEq":
-                    opeq = f"{args[3]} >= {args[4]}"
-                case "strictEqual":
-                    opeq = "0"
-
-                case "shl":
-                    opeq = f"{args[3]} << {args[4]}"
-                case "shr":
-                    opeq = f"{args[3]} >> {args[4]}"
-                case "or":
-                    opeq = f"{args[3]} | {args[4]}"
-                case "and":
-                    opeq = f"{args[3]} & {args[4]}"
-                case "xor":
-                    opeq = f"{args[3]} ^ {args[4]}"
-                case "not":
-                    opeq = f"~{args[3]}"
-
-                case "max":
-                    opeq = f"max({args[3]}, {args[4]})"
-                case "min":
-                    opeq = f"min({args[3]}, {args[4]})"
-                case "angle":
-                    opeq = f"(atan2({args[4]}, {args[3]}) * 180/pi) % 360"
-                case "angleDiff":
-                    opeq = f"min(({args[4]} - {args[3]})%360, ({args[3]} - {args[4]})%360)"
-                case "len":
-                    opeq = f"abs({args[3]} - {args[4]})"
-                case "noise":
-                    opeq = f"raw2d(0, {args[3]}, {args[4]})"
-                case "abs":
-                    opeq = f"abs({args[3]})"
-                case "log":
-                    opeq = f"log({args[3]})"
-                case "log10":
-                    opeq = f"log({args[3]}, 10)"
-                case "floor":
-                    opeq = f"int({args[3]})"
-                case "ceil":
-                    opeq = f"ceil({args[3]})"
-                case "sqrt":
-                    opeq = f"{args[3]} ** 0.5"
-                case "rand":
-                    opeq = f"random() * {args[3]}"
-
-                case "sin":
-                    opeq = f"sin({args[3]} / 180*pi)"
-                case "cos":
-                    opeq = f"cos({args[3]} / 180*pi)"
-                case "tan":
-                    opeq = f"tan({args[3]} / 180*pi)"
-
-                case "asin":
-                    opeq = f"asin({args[3]}) / 180*pi)"
-                case "acos":
-                    opeq = f"acos({args[3]}) / 180*pi)"
-                case "atan":
-                    opeq = f"atan({args[3]}) / 180*pi)"
-                case _:
-                    return "NotImplemented"
-            return f"_ = {opeq}; {args[2]} = _ if _ % 1 else int(_)"
-
-        case "wait":
-            return f"sleep({args[1]})"
-        case "stop":
-            return "1/0"
-        case "end":
-            return "processor_counter = 0"
-        case "jump":
-            match args[2]:
-                case "equal":
-                    cond = f"{args[3]} == {args[4]}"
-                case "notEqual":
-                    cond = f"{args[3]} != {args[4]}"
-                case "lessThan":
-                    cond = f"float({args[3]}) < float({args[4]})"
-                case "lessThanEq":
-                    cond = f"float({args[3]}) <= float({args[4]})"
-                case "greaterThan":
-                    cond = f"float({args[3]}) > float({args[4]})"
-                case "greaterThanEq":
-                    cond = f"float({args[3]}) >= float({args[4]})"
-                case "strictEqual":
-                    cond = "False"
-                case "always":
-                    cond = "True"
+TRANSLATOR_VERSION: int = 3
+"Bump when tokenizer or opcode table changes, so cached programs are recompiled"
+
+Step = Callable[[], None]
+Getter = Callable[[], object]
+Setter = Callable[[object], object]
+
+
+class Opcode(NamedTuple):
+    """
+    Entry of `OPCODES`: how to bind one mlog instruction to a processor\n
+    `operands` holds one letter per operand:\n
+    `i` - input, resolved to a getter\n
+    `o` - output, resolved to a setter\n
+    `r` - raw token, passed as is (labels, color literals)
+    """
+
+    operands: str
+    build: Callable[..., Step]
+
+    @property
+    def arity(self) -> int:
+        return len(self.operands)
+
+
+def _literal(token: str) -> object:
+    "Value of literal operand, or `_NOT_LITERAL` if `token` is a variable name"
+
+    if token in LITERALS:
+        return LITERALS[token]
+    if token[0] == '"':
+        return token.strip('"')
+    if token[0] == "@" and token not in RUNTIME_BUILTINS:
+        return Content(intern(token))  # content names and sensor properties
+    if token[0] in "-.0123456789":
+        try:
+            return int(token, 0)
+        except ValueError:
+            pass
+        try:
+            return float(token)
+        except ValueError:
+            pass
+    return _NOT_LITERAL
+
+
+_MAX_SAFE: int = 2**53
+"Biggest integer that double holds exactly"
+
+
+def num(value: object) -> float:
+    "Numeric value of mlog variable: numbers as is, `null` is 0, any other object is 1"
+    if type(value) is int or type(value) is float:
+        return value  # type: ignore
+    return 0 if value is None else 1
+
+
+def isobj(value: object) -> bool:
+    "`True` if value is not a number(`null`, string, building...)"
+    return not (type(value) is int or type(value) is float)
+
+
+def mlog_number(value: float) -> float | None:
+    """Value as mlog stores it: a finite double\n
+    integers beyond double precision are rounded, NaN and infinities become `null`"""
+
+    if type(value) is int:
+        if -_MAX_SAFE <= value <= _MAX_SAFE:
+            return value
+        value = float(value)
+    return value if isfinite(value) else None
+
+
+def _java_double(value: float) -> str:
+    "Java `Double.toString`: shortest digits, plain between 10^-3 and 10^7, `1.0E-7` style outside"
+
+    digits, exponent = Decimal(repr(abs(value))).normalize().as_tuple()[1:]
+    text = "".join(map(str, digits))
+    point = len(text) + exponent  # type: ignore
+    sign = "-" if value < 0 else ""
+    if 1e-3 <= abs(value) < 1e7:
+        if point <= 0:
+            return f"{sign}0.{'0'*-point}{text}"
+        if point >= len(text):
+            return f"{sign}{text}{'0'*(point-len(text))}.0"
+        return f"{sign}{text[:point]}.{text[point:]}"
+    return f"{sign}{text[0]}.{text[1:] or '0'}E{point-1}"
+
+
+def mlog_str(value: object) -> str:
+    "Text that `print` outputs for value"
+
+    if type(value) is int:
+        return str(value)
+    if type(value) is float:
+        whole = min(max(int(value), -2**63), 2**63-1)  # Java (long) cast saturates
+        if abs(value - whole) < 0.00001:
+            return str(whole)
+        return _java_double(value)
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _long(value: float) -> int:
+    "Java `(long)` cast: truncates towards zero"
+    return int(value)
+
+
+def _wrap64(value: int) -> int:
+    "Overflows like Java `long`"
+    return (value + 2**63) % 2**64 - 2**63
+
+
+def _remainder(a: float, b: float) -> float:
+    "Java `%`: sign follows dividend"
+    if type(a) is int and type(b) is int:
+        r = abs(a) % abs(b)
+        return r if a >= 0 else -r
+    return fmod(a, b)
+
+
+def _equal(a: object, b: object) -> bool:
+    if type(a) is int and type(b) is int:
+        return a == b
+    if isobj(a) and isobj(b):
+        return a == b
+    return abs(num(a) - num(b)) < 0.000001
+
+
+def _strict_equal(a: object, b: object) -> bool:
+    if isobj(a) != isobj(b):
+        return False
+    return a == b
+
+
+def _less(a: object, b: object) -> bool:
+    return num(a) < num(b)
+
+
+def _less_eq(a: object, b: object) -> bool:
+    return num(a) <= num(b)
+
+
+def _greater(a: object, b: object) -> bool:
+    return num(a) > num(b)
+
+
+def _greater_eq(a: object, b: object) -> bool:
+    return num(a) >= num(b)
+
+
+def _angle(x: float, y: float) -> float:
+    angle = degrees(atan2(y, x))
+    return angle + 360 if angle < 0 else angle
+
+
+def _angle_diff(a: float, b: float) -> float:
+    return min((a - b) % 360, (b - a) % 360)
+
+
+def _unop(fn: Callable[[float], float],
+          fast: Callable[[int], float] | None = None) -> Callable[..., Step]:
+    """Builder of unary `op`\n
+    `fast` is used instead of `fn` when operand is `int`"""
+
+    fast = fn if fast is None else fast
+
+    def build(p: "Processor", out: Setter, a: Getter, _: Getter) -> Step:
+        def step():
+            x = a()
+            try:
+                if type(x) is int:
+                    r = fast(x)
+                    if -_MAX_SAFE <= r <= _MAX_SAFE:
+                        out(r)
+                        return
+                else:
+                    r = fn(num(x))
+                out(mlog_number(r))
+            except (ArithmeticError, ValueError):
+                out(None)
+        return step
+    return build
+
+
+def _binop(fn: Callable[[float, float], float],
+           fast: Callable[[int, int], float] | None = None) -> Callable[..., Step]:
+    """Builder of binary `op`\n
+    `fast` is used instead of `fn` when both operands are `int`"""
+
+    fast = fn if fast is None else fast
+
+    def build(p: "Processor", out: Setter, a: Getter, b: Getter) -> Step:
+        def step():
+            x = a()
+            y = b()
+            try:
+                if type(x) is int and type(y) is int:
+                    r = fast(x, y)
+                    if -_MAX_SAFE <= r <= _MAX_SAFE:
+                        out(r)
+                        return
+                else:
+                    r = fn(num(x), num(y))
+                out(mlog_number(r))
+            except (ArithmeticError, ValueError):
+                out(None)
+        return step
+    return build
+
+
+def _cmpop(cond: Callable[[object, object], bool]) -> Callable[..., Step]:
+    "Builder of comparison `op`, stores 1 or 0"
+
+    def build(p: "Processor", out: Setter, a: Getter, b: Getter) -> Step:
+        def step():
+            out(1 if cond(a(), b()) else 0)
+        return step
+    return build
+
+
+def _jump(cond: Callable[[object, object], object]) -> Callable[..., Step]:
+    def build(p: "Processor", target: str, a: Getter, b: Getter) -> Step:
+        dest = int(target)
+
+        def step():
+            if cond(a(), b()):
+                p.counter = dest
+        return step
+    return build
+
+
+def _read(p: "Processor", out: Setter, cell: Getter, at: Getter) -> Step:
+    def step():
+        memory = cell()
+        if isinstance(memory, list):
+            address = int(num(at()))
+            out(memory[address] if 0 <= address < len(memory) else 0)
+    return step
+
+
+def _write(p: "Processor", value: Getter, cell: Getter, at: Getter) -> Step:
+    def step():
+        memory = cell()
+        if isinstance(memory, list):
+            address = int(num(at()))
+            if 0 <= address < len(memory):
+                memory[address] = num(value())
+    return step
+
+
+def _draw_clear(p: "Processor", r: Getter, g: Getter, b: Getter) -> Step:
+    def step():
+        p.surface.fill((r(), g(), b()))
+    return step
+
+
+def _draw_color(p: "Processor", r: Getter, g: Getter, b: Getter, a: Getter) -> Step:
+    def step():
+        p.color = (r(), g(), b(), a())
+    return step
+
+
+def _draw_col(p: "Processor", color: str) -> Step:
+    rgb = (int(color[1:3], base=16), int(color[3:5], base=16), int(color[5:7], base=16))
+
+    def step():
+        p.color = rgb
+    return step
+
+
+def _draw_stroke(p: "Processor", width: Getter) -> Step:
+    def step():
+        p.width = width()  # type: ignore
+    return step
+
+
+def _draw_line(p: "Processor", x1: Getter, y1: Getter, x2: Getter, y2: Getter) -> Step:
+    def step():
+        draw.line(p.surface, p.color, (x1(), y1()), (x2(), y2()), p.width)  # type: ignore
+    return step
+
+
+def _draw_rect(p: "Processor", x: Getter, y: Getter, w: Getter, h: Getter) -> Step:
+    def step():
+        draw.rect(p.surface, p.color, (x(), y(), w(), h()))  # type: ignore
+    return step
+
+
+def _draw_linerect(p: "Processor", x: Getter, y: Getter, w: Getter, h: Getter) -> Step:
+    def step():
+        draw.rect(p.surface, p.color, (x(), y(), w(), h()), p.width)  # type: ignore
+    return step
+
+
+def _poly_points(x: float, y: float, sides: int, radius: float, rotation: float) -> list[tuple[float, float]]:
+    return [(x + cos(pi*2/sides*j + rotation)*radius, y + sin(pi*2/sides*j + rotation)*radius)
+            for j in range(sides)]
+
+
+def _draw_poly(p: "Processor", x: Getter, y: Getter, sides: Getter, radius: Getter, rotation: Getter) -> Step:
+    def step():
+        draw.polygon(p.surface, p.color, _poly_points(x(), y(), int(sides()), radius(), rotation()))  # type: ignore
+    return step
+
+
+def _draw_linepoly(p: "Processor", x: Getter, y: Getter, sides: Getter, radius: Getter, rotation: Getter) -> Step:
+    def step():
+        draw.polygon(p.surface, p.color, _poly_points(x(), y(), int(sides()), radius(), rotation()), p.width)  # type: ignore
+    return step
+
+
+def _draw_triangle(p: "Processor", x1: Getter, y1: Getter, x2: Getter, y2: Getter, x3: Getter, y3: Getter) -> Step:
+    def step():
+        draw.polygon(p.surface, p.color, ((x1(), y1()), (x2(), y2()), (x3(), y3())))  # type: ignore
+    return step
+
+
+def _print(p: "Processor", value: Getter) -> Step:
+    def step():
+        if len(p.textbuffer) < MAX_TEXT_BUFFER:
+            p.textbuffer += mlog_str(value())
+    return step
+
+
+def _drawflush(p: "Processor", display: Getter) -> Step:
+    def step():
+        display().blit(p.surface, (0, 0))  # type: ignore
+        p.flushes += 1
+    return step
+
+
+def _printflush(p: "Processor", message: Getter) -> Step:
+    def step():
+        if isinstance(target := message(), MessageBlock):
+            target.publish(p.textbuffer)
+        p.textbuffer = ""
+        p.flushes += 1
+    return step
+
+
+def _sensor(p: "Processor", out: Setter, target: Getter, prop: Getter) -> Step:
+    def step():
+        obj = target()
+        out(obj.sense(prop()) if isinstance(obj, WorldObject) else None)
+    return step
+
+
+def _getlink(p: "Processor", out: Setter, index: Getter) -> Step:
+    def step():
+        i = int(num(index()))
+        out(p.links[i] if 0 <= i < len(p.links) else None)
+    return step
+
+
+def _control(name: str, *keys: str) -> Callable[..., Step]:
+    "`control` that writes its operands into building properties `keys`"
+
+    def build(p: "Processor", target: Getter, *values: Getter) -> Step:
+        def step():
+            if isinstance(building := target(), Building):
+                building.properties.update(zip(keys, (i() for i in values)))
+        return step
+    build.__name__ = f"_control_{name}"
+    return build
+
+
+def _radar(p: "Processor",
+           target1: str, target2: str, target3: str, sort: str,
+           source: Getter, order: Getter, out: Setter) -> Step:
+    targets = (target1, target2, target3)
+
+    def step():
+        origin = source()
+        if p.world is None or not isinstance(origin, WorldObject):
+            out(None)
+        else:
+            out(p.world.radar(origin, targets, sort, num(order())))
+    return step
+
+
+def _uradar(p: "Processor",
+            target1: str, target2: str, target3: str, sort: str,
+            source: Getter, order: Getter, out: Setter) -> Step:
+    return _radar(p, target1, target2, target3, sort, lambda: p.unit, order, out)
+
+
+def _ubind(p: "Processor", kind: Getter) -> Step:
+    def step():
+        value = kind()
+        if isinstance(value, Unit):
+            p.unit = value
+        elif p.world is not None and isinstance(value, Content):
+            p.unit = p.world.bind(value, p.team, p.unit)
+        else:
+            p.unit = None
+    return step
+
+
+def _ulocate(p: "Processor",
+             find: str, group: str, enemy: Getter, ore: Getter,
+             out_x: Setter, out_y: Setter, found: Setter, building: Setter) -> Step:
+    def step():
+        result: Building | None = None
+        if p.world is not None and p.unit is not None:
+            match find:
+                case "ore":
+                    result = p.world.locate_ore(p.unit, ore())  # type: ignore
+                case "building":
+                    result = p.world.locate(p.unit, group, num(enemy()) != 0)
+                case "spawn":
+                    result = p.world.locate(p.unit, "spawn", True)
+                case "damaged":
+                    result = p.world.locate_damaged(p.unit)
+        if result is None:
+            found(0)
+            building(None)
+        else:
+            out_x(result.x)
+            out_y(result.y)
+            found(1)
+            building(None if find == "ore" else result)
+    return step
+
+
+def _ucontrol_target(p: "Processor", x: Getter, y: Getter, radius: Getter = repeat(0).__next__) -> Step:
+    def step():
+        if p.unit is not None and p.world is not None:
+            p.world.steer(p.unit, (num(x()), num(y()), num(radius())))
+    return step
+
+
+def _ucontrol_idle(p: "Processor") -> Step:
+    def step():
+        if p.unit is not None and p.world is not None:
+            p.world.steer(p.unit, None)
+    return step
+
+
+def _ucontrol_within(p: "Processor", x: Getter, y: Getter, radius: Getter, out: Setter) -> Step:
+    def step():
+        out(int(p.unit is not None and p.unit.dst(num(x()), num(y())) < num(radius())))
+    return step
+
+
+def _ucontrol_property(name: str) -> Callable[..., Step]:
+    "`ucontrol` that sets property of bound unit"
+
+    def build(p: "Processor", value: Getter) -> Step:
+        def step():
+            if p.unit is not None:
+                p.unit.properties[name] = value()
+        return step
+    build.__name__ = f"_ucontrol_{name}"
+    return build
+
+
+def _ucontrol_unbind(p: "Processor") -> Step:
+    def step():
+        p.unit = None
+    return step
+
+
+def _set(p: "Processor", out: Setter, value: Getter) -> Step:
+    def step():
+        out(value())
+    return step
+
+
+def _wait(p: "Processor", seconds: Getter) -> Step:
+    def step():
+        duration = num(seconds())
+        if duration > 0:
+            p.wake_at = p.clock + duration
+            p.state = ProcessorState.WAITING
+    return step
+
+
+def _stop(p: "Processor") -> Step:
+    def step():
+        p.counter -= 1
+        p.state = ProcessorState.STOPPED
+    return step
+
+
+def _end(p: "Processor") -> Step:
+    def step():
+        p.counter = 0
+    return step
+
+
+def _noop(p: "Processor") -> Step:
+    def step():
+        pass
+    return step
+
+
+LITERALS: dict[str, object] = {
+    "null": None,
+    "true": 1,
+    "false": 0,
+    "@pi": pi,
+    "@e": euler,
+    "@degToRad": pi/180,
+    "@radToDeg": 180/pi,
+    "@server": 1,
+    "@client": 0,
+    "@waveNumber": 0,
+    "@waveTime": 0,
+    "@mapw": None,
+    "@maph": None,
+}
+"Constants and built-ins that offline world doesn't change: local processor is server, there are no waves or map bounds"
+
+RUNTIME_BUILTINS: frozenset[str] = frozenset((
+    "@counter", "@time", "@tick", "@second", "@minute", "@ipt",
+    "@this", "@thisx", "@thisy", "@unit", "@links"))
+"Built-ins that `Processor` reads when instruction runs"
+_NOT_LITERAL = object()
+
+OPCODES: dict[tuple[str, str | None], Opcode] = {
+    ("read", None):          Opcode("oii", _read),
+    ("write", None):         Opcode("iii", _write),
+
+    ("draw", "clear"):       Opcode("iii", _draw_clear),
+    ("draw", "color"):       Opcode("iiii", _draw_color),
+    ("draw", "col"):         Opcode("r", _draw_col),
+    ("draw", "stroke"):      Opcode("i", _draw_stroke),
+    ("draw", "line"):        Opcode("iiii", _draw_line),
+    ("draw", "rect"):        Opcode("iiii", _draw_rect),
+    ("draw", "lineRect"):    Opcode("iiii", _draw_linerect),
+    ("draw", "poly"):        Opcode("iiiii", _draw_poly),
+    ("draw", "linePoly"):    Opcode("iiiii", _draw_linepoly),
+    ("draw", "triangle"):    Opcode("iiiiii", _draw_triangle),
+    ("print", None):         Opcode("i", _print),
+    ("drawflush", None):     Opcode("i", _drawflush),
+    ("printflush", None):    Opcode("i", _printflush),
+
+    ("sensor", None):        Opcode("oii", _sensor),
+    ("getlink", None):       Opcode("oi", _getlink),
+    ("control", "enabled"):  Opcode("ii", _control("enabled", "enabled")),
+    ("control", "shoot"):    Opcode("iiii", _control("shoot", "shootX", "shootY", "shooting")),
+    ("control", "shootp"):   Opcode("iii", _control("shootp", "shootTarget", "shooting")),
+    ("control", "config"):   Opcode("ii", _control("config", "config")),
+    ("control", "color"):    Opcode("ii", _control("color", "color")),
+    ("radar", None):         Opcode("rrrriio", _radar),
+
+    ("set", None):           Opcode("oi", _set),
+
+    ("op", "add"):           Opcode("oii", _binop(add)),
+    ("op", "sub"):           Opcode("oii", _binop(sub)),
+    ("op", "mul"):           Opcode("oii", _binop(mul)),
+    ("op", "div"):           Opcode("oii", _binop(truediv)),
+    ("op", "idiv"):          Opcode("oii", _binop(lambda a, b: floor(a / b), floordiv)),
+    ("op", "mod"):           Opcode("oii", _binop(_remainder)),
+    ("op", "emod"):          Opcode("oii", _binop(lambda a, b: _remainder(_remainder(a, b) + b, b))),
+    ("op", "pow"):           Opcode("oii", _binop(fpow)),
+    ("op", "equal"):         Opcode("oii", _cmpop(_equal)),
+    ("op", "notEqual"):      Opcode("oii", _cmpop(lambda a, b: not _equal(a, b))),
+    ("op", "land"):          Opcode("oii", _cmpop(lambda a, b: num(a) != 0 and num(b) != 0)),
+    ("op", "lessThan"):      Opcode("oii", _cmpop(_less)),
+    ("op", "lessThanEq"):    Opcode("oii", _cmpop(_less_eq)),
+    ("op", "greaterThan"):   Opcode("oii", _cmpop(_greater)),
+    ("op", "greaterThanEq"): Opcode("oii", _cmpop(_greater_eq)),
+    ("op", "strictEqual"):   Opcode("oii", _cmpop(_strict_equal)),
+    ("op", "shl"):           Opcode("oii", _binop(lambda a, b: _wrap64(_long(a) << (_long(b) & 63)))),
+    ("op", "shr"):           Opcode("oii", _binop(lambda a, b: _long(a) >> (_long(b) & 63))),
+    ("op", "ushr"):          Opcode("oii", _binop(lambda a, b: _wrap64((_long(a) % 2**64) >> (_long(b) & 63)))),
+    ("op", "or"):            Opcode("oii", _binop(lambda a, b: _long(a) | _long(b))),
+    ("op", "and"):           Opcode("oii", _binop(lambda a, b: _long(a) & _long(b))),
+    ("op", "xor"):           Opcode("oii", _binop(lambda a, b: _long(a) ^ _long(b))),
+    ("op", "not"):           Opcode("oii", _unop(lambda a: ~_long(a))),
+    ("op", "max"):           Opcode("oii", _binop(max)),
+    ("op", "min"):           Opcode("oii", _binop(min)),
+    ("op", "angle"):         Opcode("oii", _binop(_angle)),
+    ("op", "angleDiff"):     Opcode("oii", _binop(_angle_diff)),
+    ("op", "len"):           Opcode("oii", _binop(hypot)),
+    ("op", "noise"):         Opcode("oii", _binop(lambda a, b: raw2d(0, a, b))),
+    ("op", "abs"):           Opcode("oii", _unop(abs)),
+    ("op", "sign"):          Opcode("oii", _unop(lambda a: (a > 0) - (a < 0))),
+    ("op", "log"):           Opcode("oii", _unop(log)),
+    ("op", "logn"):          Opcode("oii", _binop(lambda a, b: log(a) / log(b))),
+    ("op", "log10"):         Opcode("oii", _unop(log10)),
+    ("op", "floor"):         Opcode("oii", _unop(floor, int)),
+    ("op", "ceil"):          Opcode("oii", _unop(ceil, int)),
+    ("op", "round"):         Opcode("oii", _unop(lambda a: floor(a + 0.5), int)),
+    ("op", "sqrt"):          Opcode("oii", _unop(sqrt)),
+    ("op", "rand"):          Opcode("oii", _unop(lambda a: random() * a)),
+    ("op", "sin"):           Opcode("oii", _unop(lambda a: sin(radians(a)))),
+    ("op", "cos"):           Opcode("oii", _unop(lambda a: cos(radians(a)))),
+    ("op", "tan"):           Opcode("oii", _unop(lambda a: tan(radians(a)))),
+    ("op", "asin"):          Opcode("oii", _unop(lambda a: degrees(asin(a)))),
+    ("op", "acos"):          Opcode("oii", _unop(lambda a: degrees(acos(a)))),
+    ("op", "atan"):          Opcode("oii", _unop(lambda a: degrees(atan(a)))),
+
+    ("wait", None):          Opcode("i", _wait),
+    ("stop", None):          Opcode("", _stop),
+    ("end", None):           Opcode("", _end),
+    ("jump", "equal"):       Opcode("rii", _jump(_equal)),
+    ("jump", "notEqual"):    Opcode("rii", _jump(lambda a, b: not _equal(a, b))),
+    ("jump", "lessThan"):    Opcode("rii", _jump(_less)),
+    ("jump", "lessThanEq"):  Opcode("rii", _jump(_less_eq)),
+    ("jump", "greaterThan"): Opcode("rii", _jump(_greater)),
+    ("jump", "greaterThanEq"): Opcode("rii", _jump(_greater_eq)),
+    ("jump", "strictEqual"): Opcode("rii", _jump(_strict_equal)),
+    ("jump", "always"):      Opcode("rii", _jump(lambda a, b: True)),
+
+    ("ubind", None):         Opcode("i", _ubind),
+    ("ucontrol", "idle"):    Opcode("", _ucontrol_idle),
+    ("ucontrol", "stop"):    Opcode("", _ucontrol_idle),
+    ("ucontrol", "move"):    Opcode("ii", _ucontrol_target),
+    ("ucontrol", "approach"): Opcode("iii", _ucontrol_target),
+    ("ucontrol", "within"):  Opcode("iiio", _ucontrol_within),
+    ("ucontrol", "boost"):   Opcode("i", _ucontrol_property("boosting")),
+    ("ucontrol", "flag"):    Opcode("i", _ucontrol_property("flag")),
+    ("ucontrol", "unbind"):  Opcode("", _ucontrol_unbind),
+    ("uradar", None):        Opcode("rrrriio", _uradar),
+    ("ulocate", None):       Opcode("rriioooo", _ulocate),
+}
+"(instruction, subop) -> Opcode. Instructions without subop use `None`"
+
+SUBOP_INSTRUCTIONS: frozenset[str] = frozenset(i for i, s in OPCODES if s is not None)
+
+OPCODE_KEYS: tuple[tuple[str, str | None], ...] = tuple(OPCODES)
+"Opcode id -> `OPCODES` key"
+
+_OPCODE_IDS: dict[tuple[str, str | None], int] = {key: i for i, key in enumerate(OPCODE_KEYS)}
+
+
+class Instruction(NamedTuple):
+    """
+    One tokenized instruction of mlog\n
+    `opcode` is index into `OPCODE_KEYS`(-1 for unknown instruction), `line` is source line,
+    `span` is columns of instruction in that line, comments and indentation are left out
+    """
+
+    opcode: int
+    name: str
+    operands: tuple[str, ...]
+    line: int
+    span: tuple[int, int]
+
+    def __str__(self) -> str:
+        return " ".join((self.name, *self.operands))
+
+
+_TOKEN = re_compile(r'"[^"]*"?|#.*|[^\s"#]+')
+"Quoted string, comment or plain token"
+
+
+def _opcode_key(name: str, args: tuple[str, ...]) -> tuple[str, str | None]:
+    if name == "jump":
+        return ("jump", args[1] if len(args) > 1 else None)
+    if name in SUBOP_INSTRUCTIONS:
+        return (name, args[0] if args else None)
+    return (name, None)
+
+
+def tokenize(code: str | list[str]) -> tuple[Instruction, ...]:
+    """Splits mlog into instructions\n
+    Empty lines, comments and `label:` lines are not instructions, like in the game:
+    jump targets are instruction indices, and labels are replaced with index of instruction that follows them"""
+
+    lines = code.split("\n") if isinstance(code, str) else code
+    found: list[tuple[list[str], int, tuple[int, int]]] = []
+    labels: dict[str, str] = {}
+    for n, line in enumerate(lines):
+        tokens: list[str] = []
+        start = end = 0
+        for match in _TOKEN.finditer(line):
+            if match[0][0] == "#":
+                break
+            if not tokens:
+                start = match.start()
+            end = match.end()
+            tokens.append(intern(match[0]))
+        if len(tokens) == 1 and tokens[0].endswith(":") and tokens[0][0] != '"':
+            labels[tokens[0][:-1]] = str(len(found))
+        elif tokens:
+            found.append((tokens, n, (start, end)))
+
+    program: list[Instruction] = []
+    for tokens, n, span in found:
+        name, args = tokens[0], tuple(tokens[1:])
+        if name == "jump" and args and args[0] in labels:
+            args = (labels[args[0]], *args[1:])
+        program.append(Instruction(_OPCODE_IDS.get(_opcode_key(name, args), -1), name, args, n, span))
+    return tuple(program)
+
+
+def lookup_opcode(instruction: Instruction) -> tuple[Opcode | None, tuple[str, ...]]:
+    """Finds table entry for instruction\n
+    returns entry(or `None` if instruction is unknown) and remaining operands\n
+    `jump` keeps its label before condition, so it is moved to the front"""
+
+    args = instruction.operands
+    if instruction.opcode < 0:
+        return None, args
+    name, subop = OPCODE_KEYS[instruction.opcode]
+    if name == "jump":
+        return OPCODES[(name, subop)], (args[0], *args[2:])
+    if subop is not None:
+        return OPCODES[(name, subop)], args[1:]
+    return OPCODES[(name, None)], args
+
+
+PROCESSOR_TIERS: dict[str, int] = {
+    "micro": 2,
+    "logic": 8,
+    "hyper": 25,
+}
+"Instructions per tick of each processor block"
+
+TICKS_PER_SECOND: int = 60
+
+
+class CostReport(NamedTuple):
+    """
+    Result of `analyze_cost`, keys are source lines of instructions\n
+    `loops` - loop header -> instructions in the longest iteration\n
+    `frames` - `drawflush` -> instructions in the longest path since previous `drawflush`(or start),
+    `None` if a loop without `drawflush` makes it unbounded\n
+    `dynamic` - lines that write `@counter`, their targets are unknown so they end paths
+    """
+
+    loops: dict[int, int]
+    frames: dict[int, int | None]
+    dynamic: tuple[int, ...]
+
+    def fps(self, line: int, tier: str) -> float | None:
+        "Frames per second that `drawflush` at line gets on processor tier, at most one per tick"
+
+        length = self.frames.get(line)
+        if not length:
+            return None
+        return min(TICKS_PER_SECOND, TICKS_PER_SECOND * PROCESSOR_TIERS[tier] / length)
+
+
+def _successors(program: tuple[Instruction, ...]) -> tuple[list[list[int]], list[int]]:
+    "Control flow graph: instructions each instruction can pass control to, and ones with unknown targets"
+
+    size = len(program)
+    successors: list[list[int]] = []
+    dynamic: list[int] = []
+    for i, instruction in enumerate(program):
+        following = i + 1 if i + 1 < size else 0
+        opcode, operands = lookup_opcode(instruction)
+        if opcode is not None and any(kind == "o" and token == "@counter"
+                                      for kind, token in zip(opcode.operands, operands)):
+            dynamic.append(i)
+            successors.append([])
+            continue
+
+        match instruction.name:
+            case "jump":
+                try:
+                    target = int(instruction.operands[0])
+                except (IndexError, ValueError):
+                    dynamic.append(i)
+                    successors.append([])
+                    continue
+                target = target if 0 <= target < size else 0
+                always = len(instruction.operands) < 2 or instruction.operands[1] == "always"
+                successors.append([target] if always else [target, following])
+            case "end":
+                successors.append([0])
+            case "stop":
+                successors.append([])
+            case _:
+                successors.append([following])
+    return successors, dynamic
+
+
+def analyze_cost(program: tuple[Instruction, ...]) -> CostReport:
+    """Static instruction counts of program, without running it\n
+    every jump backwards(and wrap from the last line to the first) closes a loop,
+    its iteration is the longest path from target to jump going only forward"""
+
+    successors, dynamic = _successors(program)
+    size = len(program)
+
+    loops: dict[int, int] = {}
+    for end, targets in enumerate(successors):
+        for header in targets:
+            if header > end:
+                continue
+            longest = [0] * (end + 1)
+            longest[header] = 1
+            for i in range(header, end):
+                if longest[i]:
+                    for j in successors[i]:
+                        if i < j <= end and longest[j] <= longest[i]:
+                            longest[j] = longest[i] + 1
+            if longest[end]:
+                loops[header] = max(loops.get(header, 0), longest[end])
+
+    flushes = [i for i, instruction in enumerate(program) if instruction.name == "drawflush"]
+    frames: dict[int, int | None] = {}
+    if flushes:
+        # drawflush ends a frame, so paths stop there
+        edges = [[] if program[i].name == "drawflush" else successors[i] for i in range(size)]
+        sources = {0, *(j for i in flushes for j in successors[i])}
+
+        reachable: set[int] = set(sources)
+        stack = list(sources)
+        while stack:
+            for j in edges[stack.pop()]:
+                if j not in reachable:
+                    reachable.add(j)
+                    stack.append(j)
+
+        incoming = dict.fromkeys(reachable, 0)
+        for i in reachable:
+            for j in edges[i]:
+                incoming[j] += 1
+        longest = dict.fromkeys(reachable, 0)
+        for i in sources:
+            longest[i] = 1
+        ready = [i for i in reachable if not incoming[i]]
+        done: set[int] = set()
+        while ready:
+            i = ready.pop()
+            done.add(i)
+            for j in edges[i]:
+                if longest[i] and longest[j] <= longest[i]:
+                    longest[j] = longest[i] + 1
+                incoming[j] -= 1
+                if not incoming[j]:
+                    ready.append(j)
+
+        for i in flushes:
+            if i in reachable:
+                frames[program[i].line] = longest[i] if i in done else None  # not done: a cycle leads here
+    return CostReport({program[i].line: length for i, length in loops.items()}, frames,
+                      tuple(program[i].line for i in dynamic))
+
+
+MAX_TEXT_BUFFER: int = 400
+"`print` stops appending when processor text buffer is this long"
+
+
+class MessageBlock:
+    """
+    Linked message block: shows text that `printflush` publishes into it\n
+    Last `history` messages are kept, rendered lines are cached until next publish
+    """
+
+    max_length: int = 220
+
+    def __init__(self, history: int = 32):
+        self.messages: deque[str] = deque([""], maxlen=history)
+        self.flushes: int = 0
+        self._surfaces: list[Surface] | None = None
+        self._style: tuple[font.Font, ColorValue] | None = None
+        "Font and color cached surfaces were rendered with"
+
+    def __str__(self) -> str:
+        return self.messages[-1]
+
+    @property
+    def text(self) -> str:
+        "Currently shown message"
+        return self.messages[-1]
+
+    def publish(self, text: str) -> None:
+        self.messages.append(text[:self.max_length])
+        self.flushes += 1
+        self._surfaces = None
+
+    def render(self, font_object: font.Font, color: ColorValue) -> list[Surface]:
+        "One surface per line of current message, cached until next publish or change of font or color"
+
+        if self._surfaces is None or self._style != (font_object, color):
+            self._surfaces = [font_object.render(i, True, color) for i in self.text.split("\n")]
+            self._style = (font_object, color)
+        return self._surfaces
+
+
+class ProcessorState(IntEnum):
+    RUNNING = 0
+    WAITING = 1
+    "Parked by `wait` until `Processor.wake_at`"
+    STOPPED = 2
+    "Halted by `stop` until program is loaded again"
+
+
+class Processor:
+    """
+    Mlog processor: variables, links and drawing state with program bound to them\n
+    Every line of program is bound once into closure, so `step` only dispatches.\n
+    `speed` is instructions per second, `clock` is seconds of processor time(set by `ProcessorScheduler`).\n
+    `links` keep link order for `getlink`, `world` answers sensor and unit instructions,
+    `building` is processor block in that world(`@this`, `@thisx`, `@thisy`)
+    """
+
+    variables: dict[str, object]
+    counter: int
+    state: ProcessorState
+    speed: float
+    clock: float
+    wake_at: float
+    color: ColorValue
+    width: int
+    textbuffer: str
+    surface: Surface
+    flushes: int
+    steps: list[Step]
+    decoded: list[str]
+    program: tuple[Instruction, ...]
+    links: list[object]
+    world: World | None
+    building: Building | None
+    unit: Unit | None
+    team: int
+
+    def __init__(self,
+                 links: dict[str, object] | None = None,
+                 size: tuple[int, int] = (176, 176),
+                 speed: float = 120,
+                 world: World | None = None,
+                 team: int = 1,
+                 building: Building | None = None):
+        self.variables = {} if links is None else dict(links)
+        self.links = list(self.variables.values())
+        self.world = world
+        self.building = building
+        self.unit = None
+        self.team = team
+        self.counter = 0
+        self.state = ProcessorState.RUNNING
+        self.speed = speed
+        self.clock = 0
+        self.wake_at = 0
+        self.color = 0
+        self.width = 1
+        self.textbuffer = ""
+        self.surface = Surface(size)
+        self.flushes = 0
+        self.steps = []
+        self.decoded = []
+        self.program = ()
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def _operand(self, token: str) -> Getter:
+        match token:
+            case "@counter":
+                return lambda: self.counter
+            case "@time":
+                return lambda: self.clock * 1000
+            case "@tick":
+                return lambda: self.clock * 60
+            case "@second":
+                return lambda: self.clock
+            case "@minute":
+                return lambda: self.clock / 60
+            case "@ipt":
+                return lambda: self.speed / TICKS_PER_SECOND
+            case "@this":
+                return lambda: self.building
+            case "@thisx":
+                return lambda: None if self.building is None else self.building.x
+            case "@thisy":
+                return lambda: None if self.building is None else self.building.y
+            case "@unit":
+                return lambda: self.unit
+            case "@links":
+                return lambda: len(self.links)
+        value = _literal(token)
+        if value is _NOT_LITERAL:
+            return partial(self.variables.get, token)
+        return repeat(value).__next__
+
+    def _output(self, token: str) -> Setter:
+        if token == "@counter":
+            return lambda a: setattr(self, "counter", int(a))  # type: ignore
+        return partial(self.variables.__setitem__, token)
+
+    def bind(self, instruction: Instruction) -> Step | None:
+        "Binds one instruction, `None` if it is not implemented"
+
+        opcode, operands = lookup_opcode(instruction)
+        if opcode is None:
+            return None
+        operands += ("0",) * (opcode.arity - len(operands))
+
+        resolved: list[object] = []
+        for kind, token in zip(opcode.operands, operands):
+            match kind:
+                case "i":
+                    resolved.append(self._operand(token))
+                case "o":
+                    resolved.append(self._output(token))
                 case _:
-                    return "NotImplemented"
-            return f"processor_counter = {args[1]}-1 if {cond} else processor_counter"
+                    resolved.append(token)
+        return opcode.build(self, *resolved)
+
+    def load(self, program: tuple[Instruction, ...]) -> "Processor":
+        "Binds program, keeping variables. Unknown instructions become no-ops"
+
+        self.steps.clear()
+        self.decoded.clear()
+        self.program = program
+        for instruction in program:
+            try:
+                step = self.bind(instruction)
+            except ValueError:
+                step = None
+            if step is None:
+                self.steps.append(_noop(self))
+                self.decoded.append("NotImplemented")
+            else:
+                self.steps.append(step)
+                self.decoded.append(str(instruction))
+        self.counter = 0
+        self.state = ProcessorState.RUNNING
+        return self
+
+    def step(self) -> None:
+        "Runs instruction under counter"
+
+        if not 0 <= self.counter < len(self.steps):
+            self.counter = 0
+        i = self.counter
+        self.counter = i + 1
+        self.steps[i]()
+
+
+class ProcessorScheduler:
+    """
+    Runs processors for given time, each at its own `speed`\n
+    Processor that executed `wait` is parked in a heap ordered by wake-up time,
+    so parked processors cost nothing until they are due. Stopped processors and ones without
+    program are dropped until they are added again
+    """
+
+    def __init__(self):
+        self.time: float = 0
+        self.max_step: float = 0.25
+        "Longest time one `advance` runs processors for, so a stall doesn't turn into a burst"
+        self._running: dict[Processor, float] = {}
+        self._parked: list[tuple[float, int, Processor]] = []
+        self._order: count = count()
+
+    def __len__(self) -> int:
+        return len(self._running) + len(self._parked)
+
+    @property
+    def running(self) -> int:
+        "Number of processors that are not parked or stopped"
+        return len(self._running)
+
+    @property
+    def next_wake(self) -> float | None:
+        "Seconds until first parked processor wakes up"
+        return max(0, self._parked[0][0] - self.time) if self._parked else None
+
+    def add(self, processor: Processor) -> None:
+        "Schedules processor according to its state, call again after loading new program"
+
+        processor.clock = self.time
+        match processor.state:
+            case ProcessorState.RUNNING if processor.steps:
+                self._running.setdefault(processor, 0)
+            case ProcessorState.WAITING:
+                self._running.pop(processor, None)
+                heappush(self._parked, (processor.wake_at, next(self._order), processor))
+            case _:
+                self._running.pop(processor, None)
+
+    def remove(self, processor: Processor) -> None:
+        self._running.pop(processor, None)
+        processor.state = ProcessorState.STOPPED  # parked entry is skipped when it comes up
+
+    def advance(self, seconds: float) -> list[Exception]:
+        "Runs processors for `seconds`, returns errors raised by instructions"
+
+        self.time += seconds
+        seconds = min(seconds, self.max_step)
+        while self._parked and self._parked[0][0] <= self.time:
+            wake_at, _, processor = heappop(self._parked)
+            if processor.state == ProcessorState.WAITING and processor.wake_at == wake_at:
+                processor.state = ProcessorState.RUNNING
+                self._running[processor] = 0
+
+        errors: list[Exception] = []
+        running = ProcessorState.RUNNING
+        for processor in list(self._running):
+            processor.clock = self.time
+            budget = self._running[processor] + seconds * processor.speed
+            if not processor.steps:
+                budget = 0
+            while budget >= 1 and processor.state == running:
+                budget -= 1
+                try:
+                    processor.step()
+                except Exception as e:
+                    errors.append(e)
+            if processor.state == running:
+                self._running[processor] = budget
+            else:
+                self.add(processor)
+        return errors
+
+
+class CompileResult(NamedTuple):
+    "What `CompileService` posts back for one source snapshot"
+
+    generation: int
+    mlog: list[str]
+    program: tuple[Instruction, ...]
+    errors: list[Exception]
+
+
+class CompileCancelled(Exception):
+    "Compile was killed because newer snapshot came"
+
+
+class CompilerProcess:
+    """
+    Compiler that runs in child process(`mlog_compile.py`), so compile in progress can be killed\n
+    `factory` is `"module:Class"` of compiler with `compile(source) -> str`.
+    Process is started on first compile and after every `cancel`
+    """
+
+    def __init__(self, factory: str):
+        self.factory: str = factory
+        self._process: Popen | None = None
+        self._cancelled: bool = False
+
+    def __call__(self, source: str) -> str:
+        "Compiles source, raises what compiler raised or `CompileCancelled`"
+
+        if self._process is None or self._process.poll() is not None:
+            self._process = Popen([executable, str(app_path/"mlog_compile.py"), self.factory],
+                                  stdin=PIPE, stdout=PIPE)
+        process = self._process
+        self._cancelled = False
+        try:
+            process.stdin.write(b64encode(pickle_dumps(source)) + b"\n")  # type: ignore
+            process.stdin.flush()  # type: ignore
+            line = process.stdout.readline()  # type: ignore
+        except OSError:
+            line = b""
+        if not line:
+            if self._cancelled:
+                raise CompileCancelled()
+            raise RuntimeError(f"compiler process exited with code {process.wait()}")
+        reply = pickle_loads(b64decode(line))
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def cancel(self) -> None:
+        "Kills compile in progress, next compile starts new process"
+
+        if self._process is not None:
+            self._cancelled = True
+            self._process.kill()
+
+
+class CompileService:
+    """
+    Compiles source snapshots on worker thread, so editing never waits for compiler\n
+    Only the newest snapshot matters: queued snapshot is replaced by newer one.
+    Compile that was overtaken by edit while running is cancelled if `compile` has `cancel()`
+    (like `CompilerProcess`), otherwise it runs to the end and its result is thrown away
+    """
+
+    def __init__(self,
+                 compile: Callable[[str], str],
+                 cache: "CompileCache | None" = None):
+        self._compile: Callable[[str], str] = compile
+        self._cache: CompileCache | None = cache
+        self._condition: Condition = Condition()
+        self._snapshot: tuple[int, str] | None = None
+        self._result: CompileResult | None = None
+        self._latest: int = -1
+        self._compiling: bool = False
+        self.cancelled: int = 0
+
+        Thread(target=self._work, daemon=True).start()
+
+    @property
+    def pending(self) -> bool:
+        "Snapshot is queued or compiling, or its result is not taken yet"
+        return self._snapshot is not None or self._compiling or self._result is not None
+
+    @property
+    def latest(self) -> int:
+        "Generation of the newest submitted snapshot"
+        return self._latest
+
+    def submit(self, generation: int, source: str) -> None:
+        "Queues snapshot of source tagged with edit generation"
+
+        with self._condition:
+            if self._snapshot is not None:
+                self.cancelled += 1
+            self._snapshot = (generation, source)
+            self._latest = generation
+            if self._compiling and (cancel := getattr(self._compile, "cancel", None)) is not None:
+                cancel()
+            self._condition.notify()
+
+    def poll(self) -> CompileResult | None:
+        "Takes result of the newest snapshot if it is ready"
+
+        with self._condition:
+            result, self._result = self._result, None
+        if result is None or result.generation != self._latest:
+            return None
+        return result
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while self._snapshot is None:
+                    self._condition.wait()
+                (generation, source), self._snapshot = self._snapshot, None
+                self._compiling = True
+
+            if self._cache is not None and (cached := self._cache.get(source)) is not None:
+                result = CompileResult(generation, *cached, [])
+            else:
+                try:
+                    mlog = self._compile(source).splitlines()
+                    result = CompileResult(generation, mlog, tokenize(mlog), [])
+                    if self._cache is not None:
+                        self._cache.put(source, result.mlog, result.program)
+                except CompileCancelled:
+                    result = None
+                except Exception as e:
+                    result = CompileResult(generation, [], (), [e])
+
+            with self._condition:
+                self._compiling = False
+                if result is not None and generation == self._latest:
+                    self._result = result
+                else:
+                    self.cancelled += 1
+
+
+class CompileCache:
+    """
+    Content-addressed storage of compile results in `directory`\n
+    Entry is keyed by hash of source and `version`, so changing compiler or translator
+    never serves stale programs. Least recently used entries are removed past `max_size` bytes
+    """
+
+    def __init__(self,
+                 directory: Path = app_path/"cache",
+                 version: str = "",
+                 max_size: int = 64*1024*1024):
+        self.directory: Path = directory
+        self.version: str = f"{version}/{TRANSLATOR_VERSION}"
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = sorted(self.directory.glob("*.bin"), key=lambda a: a.stat().st_mtime)
+        self._sizes: dict[str, int] = {i.stem: i.stat().st_size for i in entries}
+        self._size: int = sum(self._sizes.values())
+
+    def key(self, source: str) -> str:
+        return sha256(f"{self.version}\0{source}".encode()).hexdigest()
+
+    def get(self, source: str) -> tuple[list[str], tuple[Instruction, ...]] | None:
+        "Compiled mlog and program for source, `None` on miss"
+
+        key = self.key(source)
+        if key not in self._sizes:
+            self.misses += 1
+            return None
+        path = self.directory/f"{key}.bin"
+        try:
+            mlog, program = marshal_loads(path.read_bytes())
+            utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            self._forget(key)
+            self.misses += 1
+            return None
 
-        case _:
-            return "NotImplemented"
+        self._sizes[key] = self._sizes.pop(key)  # most recently used goes last
+        self.hits += 1
+        return mlog, tuple(map(Instruction._make, program))
+
+    def put(self, source: str, mlog: list[str], program: tuple[Instruction, ...]) -> None:
+        "Stores compile result, then evicts oldest entries until cache fits"
+
+        key = self.key(source)
+        data = marshal_dumps((mlog, tuple(map(tuple, program))))
+        path = self.directory/f"{key}.bin"
+        temporary = path.with_suffix(".tmp")
+        try:
+            temporary.write_bytes(data)
+            replace(temporary, path)
+        except OSError as e:
+            logf(e, 1)
+            return
+
+        self._forget(key, False)
+        self._sizes[key] = len(data)
+        self._size += len(data)
+        while self._size > self.max_size and len(self._sizes) > 1:
+            self._forget(next(iter(self._sizes)))
+
+    def _forget(self, key: str, unlink: bool = True) -> None:
+        self._size -= self._sizes.pop(key, 0)
+        if unlink:
+            (self.directory/f"{key}.bin").unlink(missing_ok=True)
@@ -0,0 +1,330 @@
+from bisect import bisect_left
+from itertools import count
+from json import loads as json_loads
+from math import floor, hypot
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+
+__all__ = ["Content", "WorldObject", "Building", "Unit", "World",
+           "RADAR_TARGETS", "RADAR_SORTS"]
+
+
+class Content(str):
+    """
+    Mlog content constant like `@flare` or `@copper`\n
+    Compares as its token, prints without `@` like the game does
+    """
+
+    def __str__(self) -> str:
+        return self[1:]
+
+    @property
+    def key(self) -> str:
+        "Name of property that sensor reads for this content"
+        return self[1:]
+
+    @classmethod
+    def of(cls, name: object) -> "Content":
+        "Content from token or plain name: `@copper` and `copper` give the same"
+        name = str(name)
+        return cls(name if name.startswith("@") else f"@{name}")
+
+
+class WorldObject:
+    """
+    Building or unit of simulated world\n
+    Anything sensor can read lives in `properties`, item counts included(`"copper": 10`).
+    `id` is given by `World.add` in order of adding, 0 until then
+    """
+
+    def __init__(self,
+                 kind: str, x: float, y: float,
+                 team: int = 1, name: str | None = None,
+                 **properties: object):
+        self.id: int = 0
+        self.kind: Content = Content.of(kind)
+        self.x: float = x
+        self.y: float = y
+        self.team: int = team
+        self.name: str | None = name
+        self.properties: dict[str, object] = {"health": 100, "maxHealth": 100} | properties
+
+    def __str__(self) -> str:
+        return str(self.kind)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.kind}, {self.x}, {self.y}, team={self.team})"
+
+    def sense(self, prop: object) -> object:
+        "Value of `sensor` property, `null` if object doesn't have it"
+
+        match prop:
+            case "@x":
+                return self.x
+            case "@y":
+                return self.y
+            case "@team":
+                return self.team
+            case "@type":
+                return self.kind
+            case "@name":
+                return self.name
+            case "@dead":
+                return int(self.properties["health"] <= 0)  # type: ignore
+            case Content():
+                return self.properties.get(prop.key)
+            case _:
+                return None
+
+    def dst(self, x: float, y: float) -> float:
+        return hypot(self.x - x, self.y - y)
+
+
+class Building(WorldObject):
+    """
+    Static block of world\n
+    `group` is what `ulocate building` searches by: core, storage, generator, turret, factory, repair, battery, reactor
+    """
+
+    def __init__(self,
+                 kind: str, x: float, y: float,
+                 team: int = 1, name: str | None = None, group: str | None = None,
+                 **properties: object):
+        super().__init__(kind, x, y, team, name, **properties)
+        self.group: str | None = group
+
+
+class Unit(WorldObject):
+    """
+    Unit that processors can bind and move\n
+    `speed` is world units per second, `target` is where `ucontrol move/approach` sent it(set it through `World.steer`)
+    """
+
+    def __init__(self,
+                 kind: str, x: float, y: float,
+                 team: int = 1, name: str | None = None,
+                 **properties: object):
+        super().__init__(kind, x, y, team, name, **properties)
+        self.target: tuple[float, float, float] | None = None
+        "x, y and radius to stop within"
+
+
+def _radar_target(kind: str) -> Callable[[WorldObject, Unit], bool]:
+    match kind:
+        case "enemy":
+            return lambda source, unit: unit.team != source.team
+        case "ally":
+            return lambda source, unit: unit.team == source.team
+        case "player":
+            return lambda source, unit: bool(unit.properties.get("player"))
+        case "attacker":
+            return lambda source, unit: bool(unit.properties.get("attacker"))
+        case "flying":
+            return lambda source, unit: bool(unit.properties.get("flying"))
+        case "boss":
+            return lambda source, unit: bool(unit.properties.get("boss"))
+        case "ground":
+            return lambda source, unit: not unit.properties.get("flying")
+        case _:
+            return lambda source, unit: True
+
+
+RADAR_TARGETS: dict[str, Callable[[WorldObject, Unit], bool]] = {i: _radar_target(i) for i in
+                                                                 ("any", "enemy", "ally", "player", "attacker", "flying", "boss", "ground")}
+"Radar filter -> predicate(source, unit)"
+
+RADAR_SORTS: dict[str, Callable[[float, float, Unit], float]] = {
+    "distance":  lambda x, y, unit: -unit.dst(x, y),
+    "health":    lambda x, y, unit: unit.properties.get("health", 0),
+    "shield":    lambda x, y, unit: unit.properties.get("shield", 0),
+    "armor":     lambda x, y, unit: unit.properties.get("armor", 0),
+    "maxHealth": lambda x, y, unit: unit.properties.get("maxHealth", 0),
+}
+"Radar sort -> score, the highest score(times order) wins like in the game"
+
+
+class World:
+    """
+    Offline stand-in for Mindustry world: buildings, units and a grid index over units\n
+    Units are hashed into square cells of `cell_size`, so radius queries only visit
+    cells that touch the circle. Everything is deterministic: ties go to the older object
+    """
+
+    def __init__(self, cell_size: float = 32):
+        self.cell_size: float = cell_size
+        self.buildings: list[Building] = []
+        self.units: list[Unit] = []
+        self._named: dict[str, WorldObject] = {}
+        self._groups: dict[str, list[Building]] = {}
+        self._grid: dict[tuple[int, int], list[Unit]] = {}
+        self._cells: dict[int, tuple[int, int]] = {}
+        self._kinds: dict[tuple[str, int], list[Unit]] = {}
+        "Units by kind and team in order of adding, for `bind`"
+        self._moving: dict[int, Unit] = {}
+        "Units that have not reached their target yet"
+        self._ids: count = count(1)
+
+    def __getitem__(self, name: str) -> WorldObject:
+        return self._named[name]
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def add(self, obj: WorldObject) -> WorldObject:
+        obj.id = next(self._ids)
+        if obj.name is not None:
+            self._named[obj.name] = obj
+        if isinstance(obj, Unit):
+            self.units.append(obj)
+            cell = self._cell(obj.x, obj.y)
+            self._grid.setdefault(cell, []).append(obj)
+            self._cells[obj.id] = cell
+            self._kinds.setdefault((obj.kind, obj.team), []).append(obj)
+            if obj.target is not None:
+                self._moving[obj.id] = obj
+        elif isinstance(obj, Building):
+            self.buildings.append(obj)
+            if obj.group is not None:
+                self._groups.setdefault(obj.group, []).append(obj)
+        return obj
+
+    def remove(self, obj: WorldObject) -> None:
+        if obj.name is not None:
+            self._named.pop(obj.name, None)
+        if isinstance(obj, Unit):
+            self.units.remove(obj)
+            self._grid[self._cells.pop(obj.id)].remove(obj)
+            self._kinds[(obj.kind, obj.team)].remove(obj)
+            self._moving.pop(obj.id, None)
+        elif isinstance(obj, Building):
+            self.buildings.remove(obj)
+            if obj.group is not None:
+                self._groups[obj.group].remove(obj)
+
+    def move(self, unit: Unit, x: float, y: float) -> None:
+        "Moves unit, keeping grid index up to date"
+
+        unit.x, unit.y = x, y
+        cell = self._cell(x, y)
+        old = self._cells[unit.id]
+        if cell != old:
+            self._grid[old].remove(unit)
+            self._grid.setdefault(cell, []).append(unit)
+            self._cells[unit.id] = cell
+
+    def units_within(self, x: float, y: float, radius: float) -> Iterator[Unit]:
+        "Units closer than `radius` to point, visiting only grid cells that touch the circle"
+
+        x1, y1 = self._cell(x - radius, y - radius)
+        x2, y2 = self._cell(x + radius, y + radius)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self._grid):
+            cells = self._grid.values()
+        else:
+            cells = (self._grid[i] for cx in range(x1, x2 + 1) for cy in range(y1, y2 + 1)
+                     if (i := (cx, cy)) in self._grid)
+        for cell in cells:
+            for unit in cell:
+                if unit.dst(x, y) < radius:
+                    yield unit
+
+    def radar(self,
+              source: WorldObject, targets: tuple[str, str, str],
+              sort: str, order: float) -> Unit | None:
+        "Unit that `radar` instruction at source finds, `None` if there is none in range"
+
+        checks = [RADAR_TARGETS.get(i, RADAR_TARGETS["any"]) for i in targets]
+        score = RADAR_SORTS.get(sort, RADAR_SORTS["distance"])
+        radius = float(source.properties.get("range", 0))  # type: ignore
+
+        best: Unit | None = None
+        best_key: tuple[float, int] = (float("-inf"), 0)
+        for unit in self.units_within(source.x, source.y, radius):
+            if unit is source or unit.properties.get("health", 1) <= 0:  # type: ignore
+                continue
+            if all(check(source, unit) for check in checks):
+                key = (score(source.x, source.y, unit) * order, -unit.id)
+                if key > best_key:
+                    best, best_key = unit, key
+        return best
+
+    @staticmethod
+    def _nearest(unit: Unit, buildings: Iterable[Building]) -> Building | None:
+        best: Building | None = None
+        best_key: tuple[float, int] = (float("inf"), 0)
+        for building in buildings:
+            key = (building.dst(unit.x, unit.y), building.id)
+            if key < best_key:
+                best, best_key = building, key
+        return best
+
+    def locate(self, unit: Unit, group: str, enemy: bool) -> Building | None:
+        "Closest building of group that `ulocate building` finds for unit"
+        return self._nearest(unit, (i for i in self._groups.get(group, ()) if (i.team != unit.team) == enemy))
+
+    def locate_ore(self, unit: Unit, ore: str) -> Building | None:
+        "Closest ore tile: building of group `ore` with `item` property(`copper` or `@copper`)"
+        ore = Content.of(ore)
+        return self._nearest(unit, (i for i in self._groups.get("ore", ())
+                                    if "item" in i.properties and Content.of(i.properties["item"]) == ore))
+
+    def locate_damaged(self, unit: Unit) -> Building | None:
+        "Closest building of unit team that lost some health"
+        return self._nearest(unit, (i for i in self.buildings if i.team == unit.team and
+                                    i.properties["health"] < i.properties["maxHealth"]))  # type: ignore
+
+    def bind(self, kind: str, team: int, after: Unit | None) -> Unit | None:
+        "Next unit of kind(and team) after `after`, cycling like `ubind`"
+
+        candidates = self._kinds.get((kind, team))
+        if not candidates:
+            return None
+        if after is not None:
+            i = bisect_left(candidates, after.id, key=lambda a: a.id)  # units are kept in id order
+            if i < len(candidates) and candidates[i] is after:
+                return candidates[(i + 1) % len(candidates)]
+        return candidates[0]
+
+    def steer(self, unit: Unit, target: tuple[float, float, float] | None) -> None:
+        "Sends unit to `(x, y, radius)`, `None` stops it"
+
+        unit.target = target
+        if target is None:
+            self._moving.pop(unit.id, None)
+        else:
+            self._moving[unit.id] = unit
+
+    def update(self, seconds: float) -> None:
+        "Moves units towards their targets, only units that are still on their way are visited"
+
+        for unit in list(self._moving.values()):
+            x, y, radius = unit.target  # type: ignore
+            distance = unit.dst(x, y)
+            if distance <= radius:
+                del self._moving[unit.id]
+                continue
+            step = min(float(unit.properties.get("speed", 0)) * seconds, distance - radius)  # type: ignore
+            self.move(unit, unit.x + (x - unit.x) / distance * step, unit.y + (y - unit.y) / distance * step)
+
+    @classmethod
+    def load(cls, scene: str | Path | dict) -> "World":
+        """Loads JSON scene:\n
+        `{"cell_size": 32,
+          "buildings": [{"type": "@duo", "x": 0, "y": 0, "team": 1, "name": "duo1", "group": "turret", "range": 110}],
+          "units": [{"type": "@flare", "x": 40, "y": 8, "team": 2, "speed": 20, "flying": 1}]}`\n
+        keys other than type, x, y, team, name and group become properties"""
+
+        if not isinstance(scene, dict):
+            scene = json_loads(Path(scene).read_text(encoding="utf-8"))
+
+        world = cls(scene.get("cell_size", 32))  # type: ignore
+        for kind, objects in ((Building, scene.get("buildings", ())), (Unit, scene.get("units", ()))):  # type: ignore
+            for i in objects:
+                data = dict(i)
+                world.add(kind(data.pop("type"), data.pop("x"), data.pop("y"), **data))
+        return world
+
+    def links(self) -> dict[str, WorldObject]:
+        "Named objects, to link them to processor"
+        return dict(self._named)
+
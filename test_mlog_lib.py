@@ -0,0 +1,126 @@
+"""
+Mindustry conformance of processor: `op` results and `print` formatting
+"""
+
+from mlog_lib import Processor, tokenize
+
+
+OP_CONFORMANCE: tuple[tuple[str, object], ...] = (
+    ("op add r 2 3",                 5),
+    ("op add r 0.1 0.2",             0.30000000000000004),
+    ("op add r null 1",              1),
+    ("op add r \"text\" 1",          2),
+    ("op add r 9007199254740992 1",  9007199254740992.0),
+    ("op sub r 2 5",                 -3),
+    ("op mul r 4 0.5",               2.0),
+    ("op div r 7 2",                 3.5),
+    ("op div r 1 0",                 None),
+    ("op div r 0 0",                 None),
+    ("op idiv r 7 2",                3),
+    ("op idiv r -7 2",               -4),
+    ("op idiv r 1 0",                None),
+    ("op mod r 7 3",                 1),
+    ("op mod r -7 3",                -1),
+    ("op mod r 7.5 2",               1.5),
+    ("op mod r 1 0",                 None),
+    ("op emod r -7 3",               2),
+    ("op pow r 2 10",                1024.0),
+    ("op pow r -8 0.5",              None),
+    ("op pow r 10 400",              None),
+    ("op equal r 1 1.0000001",       1),
+    ("op equal r null 0",            1),
+    ("op equal r null null",         1),
+    ("op equal r \"a\" \"a\"",       1),
+    ("op equal r \"a\" \"b\"",       0),
+    ("op equal r \"a\" 1",           1),
+    ("op notEqual r 1 2",            1),
+    ("op land r 1 0",                0),
+    ("op land r 2 -1",               1),
+    ("op lessThan r 1 2",            1),
+    ("op lessThanEq r 2 2",          1),
+    ("op greaterThan r null -1",     1),
+    ("op greaterThanEq r 1 2",       0),
+    ("op strictEqual r 1 1",         1),
+    ("op strictEqual r null 0",      0),
+    ("op strictEqual r null null",   1),
+    ("op strictEqual r 1 1.0000001", 0),
+    ("op shl r 1 4",                 16),
+    ("op shl r 1 64",                1),
+    ("op shr r -16 2",               -4),
+    ("op ushr r -1 60",              15),
+    ("op or r 5 2.9",                7),
+    ("op and r 6 3",                 2),
+    ("op xor r 6 3",                 5),
+    ("op not r 0",                   -1),
+    ("op max r 3 null",              3),
+    ("op min r -1 2",                -1),
+    ("op angle r 0 1",               90.0),
+    ("op angle r 0 -1",              270.0),
+    ("op angleDiff r 350 10",        20),
+    ("op len r 3 4",                 5.0),
+    ("op abs r -2",                  2),
+    ("op sign r -2.5",               -1),
+    ("op log r 0",                   None),
+    ("op log10 r 1000",              3.0),
+    ("op logn r 8 2",                3.0),
+    ("op floor r -1.5",              -2),
+    ("op ceil r 1.2",                2),
+    ("op round r 2.5",               3),
+    ("op sqrt r -1",                 None),
+    ("op sin r 90",                  1.0),
+    ("op cos r 180",                 -1.0),
+    ("op tan r 45",                  0.9999999999999999),
+    ("op asin r 1",                  90.0),
+    ("op acos r 2",                  None),
+    ("op atan r 1",                  45.0),
+    ("set r null",                   None),
+    ("set r true",                   1),
+    ("set r 0x10",                   16),
+)
+"mlog line that writes `r` and value it must leave in `r`, as Mindustry computes it"
+
+PRINT_CONFORMANCE: tuple[tuple[str, str], ...] = (
+    ("print 5",                                  "5"),
+    ("print 2.0",                                "2"),
+    ("print 1.000001",                           "1"),
+    ("print 0.5",                                "0.5"),
+    ("print -0.25",                              "-0.25"),
+    ("print 1234567.5",                          "1234567.5"),
+    ("op div r 1 3\nprint r",                    "0.3333333333333333"),
+    ("op add r 0.1 0.2\nprint r",                "0.30000000000000004"),
+    ("op div r 1 1000\nprint r",                 "0.001"),
+    ("op div r 1 10000\nprint r",                "1.0E-4"),
+    ("op div r 1 100000\nprint r",               "1.0E-5"),
+    ("op div r 1 10000000\nprint r",             "0"),
+    ("op div r -3 20000\nprint r",               "-1.5E-4"),
+    ("op add r 12345678 0.5\nprint r",           "1.23456785E7"),
+    ("op pow r 10 20\nprint r",                  "1.0E20"),
+    ("op pow r -10 21\nprint r",                 "-1.0E21"),
+    ("print null",                               "null"),
+    ("print \"text\"",                           "text"),
+)
+"mlog program and text it must leave in text buffer, as Mindustry prints it"
+
+
+def conformance() -> list[str]:
+    "Runs both tables, returns description of every mismatch"
+
+    failed: list[str] = []
+    for code, expected in OP_CONFORMANCE:
+        processor = Processor().load(tokenize(code))
+        processor.step()
+        got = processor.variables.get("r")
+        if got != expected:
+            failed.append(f"{code}: expected {expected!r}, got {got!r}")
+    for code, text in PRINT_CONFORMANCE:
+        lines = code.split("\n")
+        processor = Processor().load(tokenize(lines))
+        for _ in lines:
+            processor.step()
+        if processor.textbuffer != text:
+            failed.append(f"{code!r}: expected {text!r}, got {processor.textbuffer!r}")
+    return failed
+
+
+def test_conformance():
+    assert conformance() == []